@@ -1,17 +1,139 @@
 """Main application file"""
 import flask
 import datetime
+import functools
 import platform
 import os
+import threading
+import time
 
-app = flask.Flask(__name__)
+import emf
+import metrics
+import static_manifest
 
+# Static assets are served by CloudFront from S3, never by this process
+app = flask.Flask(__name__, static_folder=None)
+
+# Request latency is also written to stdout in CloudWatch Embedded Metric
+# Format, batched per EMF_FLUSH_SECONDS or EMF_MAX_SAMPLES requests
+emf_writer = None
+if os.environ.get('EMF_ENABLED', '1') == '1':
+    emf_writer = emf.EmfWriter(os.environ.get('EMF_NAMESPACE', 'Flask-microservice'),
+                               flush_interval=float(os.environ.get('EMF_FLUSH_SECONDS', '10')),
+                               max_samples=int(os.environ.get('EMF_MAX_SAMPLES', '1000')))
+
+# Requests reach the Prometheus metrics and the EMF writer from a background
+# thread every METRICS_FLUSH_SECONDS, never on the request path
+if os.environ.get('METRICS_ENABLED', '1') == '1':
+    metrics.init_app(app, emf_writer, float(os.environ.get('METRICS_FLUSH_SECONDS', '1')))
+
+# Values that cannot change for the lifetime of the process
+PYTHON_VERSION = platform.python_version()
+AWS_PLATFORM = os.environ.get('PLATFORM', 'Amazon Web Services')
+
+def positive_int_setting(environ, name, default):
+    """Return environ[name] (or default) as an int, rejecting anything but a positive integer"""
+    value = environ.get(name, default)
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise ValueError('%s must be a positive integer, got %r' % (name, value))
+    return number
+
+
+# Rendered index pages are reused for INDEX_CACHE_SECONDS, so the displayed
+# time is accurate to that bucket; INDEX_CACHE_SIZE bounds distinct names kept
+INDEX_CACHE_SECONDS = positive_int_setting(os.environ, 'INDEX_CACHE_SECONDS', '1')
+INDEX_CACHE_SIZE = positive_int_setting(os.environ, 'INDEX_CACHE_SIZE', '256')
+
+def resolve_static_url(environ):
+    """Return the base URL of the static assets, with a trailing slash
+
+    The task definition sets STATIC_URL from the /<env>/app-cdn-url SSM
+    parameter. Without it assets are linked relative to the page.
+    """
+    url = environ.get('STATIC_URL', '').rstrip('/')
+    return url + '/' if url else ''
+
+
+# Resolved once per process
+STATIC_URL = resolve_static_url(os.environ)
+
+# Hashed asset names written by the image build, read once per process;
+# templates link {{ static_url }}{{ asset('static/...') }}
+STATIC_MANIFEST = static_manifest.load_manifest(
+    os.path.join(app.root_path, static_manifest.STATIC_DIR, static_manifest.MANIFEST_NAME))
+
+
+@app.template_global()
+def asset(name):
+    """Return the hashed name of a static asset, or name when it has none"""
+    return STATIC_MANIFEST.get(name, name)
+
+# Cache-Control of each endpoint's responses, which CloudFront honours (see
+# stacks/cdn_stack.py); responses of endpoints not listed are never cached.
+# The index page may be reused for as long as its rendering is
+API_MAX_AGE = int(os.environ.get('API_MAX_AGE', '86400'))
+PAGE_MAX_AGE = int(os.environ.get('PAGE_MAX_AGE', '3600'))
+CACHE_CONTROL = {
+    'hello': 'public, max-age=%d' % INDEX_CACHE_SECONDS,
+    'returnBackwardsString': 'public, max-age=%d' % API_MAX_AGE,
+    'index': 'public, max-age=%d' % PAGE_MAX_AGE,
+    'indexmain': 'public, max-age=%d' % PAGE_MAX_AGE,
+    'liveness': 'no-store',
+    'readiness': 'no-store',
+}
+
+# Reversals of short, repeated paths (the ALB health check) are memoized;
+# longer inputs skip the cache so they cannot crowd it out
+REVERSE_CACHE_SIZE = 1024
+REVERSE_CACHE_MAX_LENGTH = 64
+
+
+@functools.lru_cache(maxsize=REVERSE_CACHE_SIZE)
+def _reverse_cached(value):
+    return value[::-1]
+
+# Set when the worker receives SIGTERM (see draining.py); readiness then
+# fails so the ALB stops routing to this task while in-flight requests finish
+draining = threading.Event()
+
+# Health check responses are built once; the probes do no other work
+LIVE_RESPONSE = ('ok', 200, {'Content-Type': 'text/plain'})
+READY_RESPONSE = ('ready', 200, {'Content-Type': 'text/plain'})
+DRAINING_RESPONSE = ('draining', 503, {'Content-Type': 'text/plain'})
+
+
+@app.after_request
+def cache_control(response):
+    """Set the endpoint's Cache-Control unless the view set one"""
+    value = CACHE_CONTROL.get(flask.request.endpoint)
+    if value is not None:
+        response.headers.setdefault('Cache-Control', value)
+    return response
+
+
+@app.route('/healthz')
+def liveness():
+    """Report that the process is up"""
+    return LIVE_RESPONSE
+
+@app.route('/readyz')
+def readiness():
+    """Report whether the process should receive traffic"""
+    if draining.is_set():
+        return DRAINING_RESPONSE
+    return READY_RESPONSE
 
 
 @app.route('/api/<random_string>')
 def returnBackwardsString(random_string):
     """Reverse and return the provided URI"""
-    return "".join(reversed(random_string))
+    if len(random_string) > REVERSE_CACHE_MAX_LENGTH:
+        return random_string[::-1]
+    return _reverse_cached(random_string)
 
 @app.route('/buritos/')
 def index():
@@ -22,19 +144,39 @@ def indexmain():
     return "The is main"
 
 
+# Set by render_index when it actually renders, i.e. on a cache miss
+_index_render = threading.local()
+
+
+@functools.lru_cache(maxsize=INDEX_CACHE_SIZE)
+def render_index(name, time_bucket):
+    """Render the index page; cached per name and time bucket.
+
+    hello() counts hits and misses in flask_index_cache_lookups_total, which
+    the metrics port merges across workers; cache_info() only sees this process.
+    """
+    _index_render.missed = True
+    with metrics.TEMPLATE_RENDER.labels('index.html').time():
+        return flask.render_template('index.html',
+                                     platform=AWS_PLATFORM,
+                                     flask_version=flask.__version__,
+                                     python_version=PYTHON_VERSION,
+                                     flask_url='https://palletsprojects.com/p/flask/',
+                                     time=datetime.datetime.now(),
+                                     static_url=STATIC_URL,
+                                     name=name)
+
+
 @app.route('/')
 def hello():
     name = flask.request.args.get("name", "Flask-demo")
-    time = datetime.datetime.now()
-    python_version = platform.python_version()
-    aws_platform = os.environ.get('PLATFORM', 'Amazon Web Services')
-    return flask.render_template('index.html',
-                                 platform=aws_platform,
-                                 flask_version=flask.__version__,
-                                 python_version=python_version,
-                                 flask_url='https://palletsprojects.com/p/flask/',
-                                 time=time,
-                                 name=name)
+    _index_render.missed = False
+    page = render_index(name, int(time.time() // INDEX_CACHE_SECONDS))
+    if _index_render.missed:
+        metrics.INDEX_CACHE_MISSES.inc()
+    else:
+        metrics.INDEX_CACHE_HITS.inc()
+    return page
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=80)
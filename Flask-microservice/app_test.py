@@ -1,6 +1,63 @@
 """Unit test file for app.py"""
-from app import returnBackwardsString
+import asyncio
+import io
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import timeit
 import unittest
+import urllib.parse
+from unittest import mock
+
+from hypothesis import given, strategies as st
+from prometheus_client import REGISTRY, generate_latest
+import uvicorn
+
+from app import app, render_index, returnBackwardsString
+import app as app_module
+import asgi
+import draining
+import emf
+import metrics
+import static_manifest
+
+# Keep the app's EMF lines out of the test output
+app_module.emf_writer.stream = io.StringIO()
+
+
+def asgi_get(path, query_string=b''):
+    """Issue a GET against the ASGI app and return (status, body)"""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': urllib.parse.unquote(path),
+        'raw_path': path.encode('utf-8'),
+        'root_path': '',
+        'query_string': query_string,
+        'headers': [(b'host', b'localhost')],
+        'server': ('localhost', 80),
+        'client': ('127.0.0.1', 12345),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi.app(scope, receive, send))
+    status = next(m['status'] for m in messages if m['type'] == 'http.response.start')
+    body = b''.join(m.get('body', b'') for m in messages if m['type'] == 'http.response.body')
+    return status, body
+
 
 class TestApp(unittest.TestCase):
     """Unit tests defined for app.py"""
@@ -11,5 +68,329 @@ class TestApp(unittest.TestCase):
         random_string_reversed = "gnirts tset ym si sihT"
         self.assertEqual(random_string_reversed, returnBackwardsString(random_string))
 
+    @given(st.text())
+    def test_reverse_matches_reference(self, random_string):
+        """Test reversal matches the join/reversed reference for any Unicode text"""
+        self.assertEqual("".join(reversed(random_string)), returnBackwardsString(random_string))
+
+    @given(st.text(min_size=1).map(lambda s: s * (app_module.REVERSE_CACHE_MAX_LENGTH // len(s) + 1)))
+    def test_reverse_long_matches_reference(self, random_string):
+        """Test reversal of inputs past the memoization limit"""
+        self.assertEqual("".join(reversed(random_string)), returnBackwardsString(random_string))
+
+    def test_reverse_edge_cases(self):
+        """Test empty, astral-plane and very long inputs"""
+        for random_string in ("", "\U0001F600a\u00e9", "ab" * 100000):
+            with self.subTest(length=len(random_string)):
+                self.assertEqual("".join(reversed(random_string)), returnBackwardsString(random_string))
+
+    def test_reverse_is_faster_than_join(self):
+        """Benchmark: reversal must stay faster than the join/reversed baseline"""
+        for random_string in ("test", "x" * 4096):
+            with self.subTest(length=len(random_string)):
+                baseline = min(timeit.repeat(lambda: "".join(reversed(random_string)), number=2000, repeat=5))
+                current = min(timeit.repeat(lambda: returnBackwardsString(random_string), number=2000, repeat=5))
+                self.assertLess(current, baseline)
+
+
+class TestHealth(unittest.TestCase):
+    """Unit tests for the liveness and readiness endpoints"""
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app_module.draining.clear()
+
+    def test_liveness(self):
+        """Test liveness always reports ok"""
+        response = self.client.get('/healthz')
+        self.assertEqual((200, b'ok'), (response.status_code, response.data))
+
+    def test_readiness_fails_while_draining(self):
+        """Test readiness flips to 503 once draining starts"""
+        self.assertEqual(200, self.client.get('/readyz').status_code)
+        app_module.draining.set()
+        self.assertEqual(503, self.client.get('/readyz').status_code)
+        self.assertEqual(200, self.client.get('/healthz').status_code)
+
+    def test_asgi_worker_drains_on_sigterm(self):
+        """Test the uvicorn server fails readiness first and exits only after the drain"""
+        server = draining.DrainingServer(uvicorn.Config(app=asgi.app))
+
+        async def sigterm():
+            with mock.patch.object(draining, 'DRAIN_SECONDS', 0):
+                server.handle_exit(signal.SIGTERM, None)
+            self.assertTrue(app_module.draining.is_set())
+            self.assertFalse(server.should_exit)
+            await asyncio.sleep(0.01)
+            self.assertTrue(server.should_exit)
+
+        asyncio.run(sigterm())
+        self.assertEqual(503, self.client.get('/readyz').status_code)
+
+
+class TestIndexCache(unittest.TestCase):
+    """Unit tests for the rendered index page cache"""
+
+    def setUp(self):
+        render_index.cache_clear()
+        self.client = app.test_client()
+
+    def test_repeat_request_is_cached(self):
+        """Test a second request for the same name in the same bucket is a hit"""
+        with mock.patch.object(app_module.time, 'time', return_value=1000.0):
+            first = self.client.get('/?name=cached').data
+            second = self.client.get('/?name=cached').data
+        self.assertEqual(first, second)
+        info = render_index.cache_info()
+        self.assertEqual((1, 1), (info.hits, info.misses))
+
+    def test_new_bucket_rerenders(self):
+        """Test a request in the next time bucket renders again"""
+        with mock.patch.object(app_module.time, 'time', return_value=1000.0):
+            self.client.get('/?name=cached')
+        with mock.patch.object(app_module.time, 'time', return_value=1000.0 + app_module.INDEX_CACHE_SECONDS):
+            self.client.get('/?name=cached')
+        self.assertEqual(2, render_index.cache_info().misses)
+
+    def test_cache_seconds_must_be_positive_int(self):
+        """Test INDEX_CACHE_SECONDS accepts whole positive seconds only"""
+        self.assertEqual(1, app_module.positive_int_setting({}, 'INDEX_CACHE_SECONDS', '1'))
+        self.assertEqual(30, app_module.positive_int_setting({'INDEX_CACHE_SECONDS': '30'}, 'INDEX_CACHE_SECONDS', '1'))
+        for value in ('0', '-5', '0.5', '2.5', 'soon', ''):
+            with self.subTest(value=value):
+                with self.assertRaisesRegex(ValueError, 'INDEX_CACHE_SECONDS'):
+                    app_module.positive_int_setting({'INDEX_CACHE_SECONDS': value}, 'INDEX_CACHE_SECONDS', '1')
+
+    def test_cache_size_must_be_positive_int(self):
+        """Test the app refuses to start with an INDEX_CACHE_SIZE that would disable or unbound the cache"""
+        for value in ('0', '-1', 'none'):
+            with self.subTest(value=value):
+                started = subprocess.run([sys.executable, '-c', 'import app'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                         env=dict(os.environ, INDEX_CACHE_SIZE=value, METRICS_ENABLED='0', EMF_ENABLED='0'),
+                                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+                self.assertNotEqual(0, started.returncode)
+                self.assertIn('INDEX_CACHE_SIZE must be a positive integer', started.stderr)
+
+    def test_cache_size_is_bounded(self):
+        """Test distinct names cannot grow the cache past its bound"""
+        for i in range(app_module.INDEX_CACHE_SIZE + 10):
+            self.client.get('/?name=n%d' % i)
+        self.assertEqual(app_module.INDEX_CACHE_SIZE, render_index.cache_info().currsize)
+
+
+class TestMetrics(unittest.TestCase):
+    """Unit tests for the Prometheus metrics"""
+
+    def scrape(self):
+        app.wsgi_app.flush()
+        return generate_latest(REGISTRY).decode('utf-8')
+
+    def test_requests_are_counted_by_route(self):
+        """Test requests are labelled with the route rule, not the raw path"""
+        client = app.test_client()
+        client.get('/api/metrics-check')
+        body = self.scrape()
+        self.assertIn('flask_http_requests_total{method="GET",route="/api/<random_string>",status="200"}', body)
+        self.assertIn('flask_http_request_duration_seconds_bucket{le="0.0005",route="/api/<random_string>"}', body)
+        self.assertIn('flask_http_requests_in_flight{route="/api/<random_string>"} 0.0', body)
+        self.assertNotIn('metrics-check', body)
+
+    def test_recorded_on_flush(self):
+        """Test the request path only buffers, and flush() records in flight requests per route"""
+        def sample(name, labels):
+            return REGISTRY.get_sample_value(name, labels) or 0
+
+        def slow_app(environ, start_response):
+            environ[metrics.ROUTE_ENVIRON_KEY] = '/slow'
+            middleware.flush()
+            in_flight.append(sample('flask_http_requests_in_flight', {'route': '/slow'}))
+            start_response('200 OK', [])
+            return [b'']
+
+        in_flight = []
+        middleware = metrics.MetricsMiddleware(slow_app, flush_interval=3600)
+        labels = {'method': 'GET', 'route': '/slow', 'status': '200'}
+        before = sample('flask_http_requests_total', labels)
+        middleware({'REQUEST_METHOD': 'GET'}, lambda status, headers, exc_info=None: None)
+        self.assertEqual([1], in_flight)
+        self.assertEqual(before, sample('flask_http_requests_total', labels))
+        middleware.flush()
+        self.assertEqual(before + 1, sample('flask_http_requests_total', labels))
+        self.assertEqual(0, sample('flask_http_requests_in_flight', {'route': '/slow'}))
+
+    def test_not_served_by_app(self):
+        """Test the app, which the ALB and CloudFront expose, has no /metrics route"""
+        self.assertEqual(404, app.test_client().get('/metrics').status_code)
+
+    def test_template_render_time(self):
+        """Test index renders are timed"""
+        render_index.cache_clear()
+        client = app.test_client()
+        client.get('/?name=metrics')
+        body = self.scrape()
+        self.assertIn('flask_template_render_seconds_count{template="index.html"}', body)
+
+    def test_index_cache_hits_and_misses(self):
+        """Test index cache lookups are counted by result"""
+        render_index.cache_clear()
+        client = app.test_client()
+
+        def lookups():
+            return tuple(REGISTRY.get_sample_value('flask_index_cache_lookups_total', {'result': result}) or 0
+                         for result in ('hit', 'miss'))
+
+        before = lookups()
+        with mock.patch.object(app_module.time, 'time', return_value=1000.0):
+            for _ in range(3):
+                client.get('/?name=counted')
+        after = lookups()
+        self.assertEqual((2, 1), (after[0] - before[0], after[1] - before[1]))
+        body = self.scrape()
+        self.assertIn('flask_index_cache_lookups_total{result="hit"}', body)
+        self.assertIn('flask_index_cache_lookups_total{result="miss"}', body)
+
+
+class TestEmf(unittest.TestCase):
+    """Unit tests for the Embedded Metric Format writer"""
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.writer = emf.EmfWriter('Test', stream=self.stream, flush_interval=3600, max_samples=1000)
+
+    def documents(self):
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def assertValidEmf(self, document):
+        directive = document['_aws']['CloudWatchMetrics'][0]
+        self.assertIsInstance(document['_aws']['Timestamp'], int)
+        self.assertEqual('Test', directive['Namespace'])
+        for dimension_set in directive['Dimensions']:
+            for dimension in dimension_set:
+                self.assertIsInstance(document[dimension], str)
+        for metric in directive['Metrics']:
+            values = document[metric['Name']]
+            self.assertLessEqual(len(values), emf.MAX_VALUES_PER_LINE)
+            self.assertTrue(all(isinstance(value, float) for value in values))
+
+    def test_samples_are_batched_until_flush(self):
+        """Test nothing is written per request and one line per route/status on flush"""
+        for _ in range(3):
+            self.writer.record('/api/<random_string>', '200', 0.002)
+        self.writer.record('unmatched', '404', 0.001)
+        self.assertEqual('', self.stream.getvalue())
+        self.writer.flush()
+        documents = self.documents()
+        self.assertEqual(2, len(documents))
+        for document in documents:
+            self.assertValidEmf(document)
+        api = next(d for d in documents if d['Route'] == '/api/<random_string>')
+        self.assertEqual(('200', [2.0, 2.0, 2.0]), (api['Status'], api['Latency']))
+
+    def test_flushes_at_size_threshold(self):
+        """Test reaching max_samples flushes and long batches are split per 100 values"""
+        self.writer.max_samples = 250
+        for _ in range(250):
+            self.writer.record('/', '200', 0.001)
+        documents = self.documents()
+        self.assertEqual([100, 100, 50], [len(d['Latency']) for d in documents])
+        for document in documents:
+            self.assertValidEmf(document)
+
+    def test_app_requests_reach_the_writer(self):
+        """Test the metrics middleware passes each request to the EMF writer"""
+        with mock.patch.object(app_module.emf_writer, 'record') as record:
+            app.test_client().get('/healthz')
+            app.wsgi_app.flush()
+        route, status, seconds = record.call_args[0]
+        self.assertEqual(('/healthz', '200'), (route, status))
+
+
+class TestCacheControl(unittest.TestCase):
+    """Every route tells CloudFront how long its response may be cached"""
+
+    def test_route_headers(self):
+        """Test the Cache-Control header each route emits"""
+        client = app.test_client()
+        expected = {
+            '/?name=cached': 'public, max-age=%d' % app_module.INDEX_CACHE_SECONDS,
+            '/api/test': 'public, max-age=86400',
+            '/buritos/': 'public, max-age=3600',
+            '/other/': 'public, max-age=3600',
+            '/healthz': 'no-store',
+            '/readyz': 'no-store',
+        }
+        for path, cache_control in expected.items():
+            with self.subTest(path=path):
+                self.assertEqual(cache_control, client.get(path).headers.get('Cache-Control'))
+
+    def test_unknown_route_not_cacheable(self):
+        """Test a 404 carries no Cache-Control"""
+        self.assertIsNone(app.test_client().get('/missing').headers.get('Cache-Control'))
+
+
+class TestStaticAssets(unittest.TestCase):
+    """The index page links static assets by their hashed names"""
+
+    def test_index_links_hashed_names(self):
+        """Test template references resolve through the manifest"""
+        manifest = {'static/css/bootstrap.min.css': 'static/css/bootstrap.min.0123456789ab.css'}
+        with mock.patch.dict(app_module.STATIC_MANIFEST, manifest):
+            body = app.test_client().get('/?name=hashed-assets').data
+        self.assertIn(b'href="static/css/bootstrap.min.0123456789ab.css"', body)
+        # Not in the manifest, so linked by its original name
+        self.assertIn(b'href="static/css/bootstrap-responsive.min.css"', body)
+
+    def test_index_links_cdn(self):
+        """Test assets are linked under the CDN URL"""
+        with mock.patch.object(app_module, 'STATIC_URL', 'https://cdn.example.com/'):
+            body = app.test_client().get('/?name=cdn-assets').data
+        self.assertIn(b'href="https://cdn.example.com/static/css/bootstrap-responsive.min.css"', body)
+
+    def test_resolve_static_url(self):
+        """Test STATIC_URL gets exactly one trailing slash and defaults to relative links"""
+        self.assertEqual(app_module.resolve_static_url({'STATIC_URL': 'https://d1.cloudfront.net'}),
+                         'https://d1.cloudfront.net/')
+        self.assertEqual(app_module.resolve_static_url({'STATIC_URL': 'https://d1.cloudfront.net/'}),
+                         'https://d1.cloudfront.net/')
+        self.assertEqual(app_module.resolve_static_url({}), '')
+
+    def test_no_static_route(self):
+        """Test the app never serves static files itself"""
+        self.assertEqual(app.test_client().get('/static/css/bootstrap.min.css').status_code, 404)
+
+    def test_manifest_read_once(self):
+        """Test the manifest file is parsed once per process"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        static_manifest.write_manifest(os.path.dirname(os.path.abspath(__file__)),
+                                       os.path.join(directory, 'manifest.json'))
+        with mock.patch('json.load', wraps=json.load) as load:
+            first = static_manifest.load_manifest(os.path.join(directory, 'manifest.json'))
+            second = static_manifest.load_manifest(os.path.join(directory, 'manifest.json'))
+        self.assertIs(first, second)
+        self.assertEqual(load.call_count, 1)
+        self.assertRegex(first['static/css/bootstrap.min.css'], r'^static/css/bootstrap\.min\.[0-9a-f]{12}\.css$')
+
+
+class TestAsgi(unittest.TestCase):
+    """The ASGI entry point must serve the same bytes as the WSGI app"""
+
+    def test_routes_match_wsgi(self):
+        """Test static routes return identical status and body in both modes"""
+        client = app.test_client()
+        for path in ('/api/test', '/api/h%C3%A9llo', '/buritos/', '/other/', '/missing'):
+            with self.subTest(path=path):
+                response = client.get(path)
+                self.assertEqual((response.status_code, response.data), asgi_get(path))
+
+    def test_index_renders(self):
+        """Test the index page renders the requested name"""
+        status, body = asgi_get('/', b'name=asgi-check')
+        self.assertEqual(200, status)
+        self.assertIn(b'<h1>asgi-check</h1>', body)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,9 @@
+"""ASGI entry point serving the Flask routes from an event loop"""
+import os
+
+from a2wsgi import WSGIMiddleware
+
+from app import app as flask_app
+
+# Requests run on a thread pool so the synchronous routes never block the loop
+app = WSGIMiddleware(flask_app, workers=int(os.environ.get('GUNICORN_THREADS', '4')))
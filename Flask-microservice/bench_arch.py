@@ -0,0 +1,104 @@
+"""Compare the per-request CPU cost of the service images across architectures
+
+Builds the Flask and Nginx images for each platform with docker buildx, runs
+them one at a time, drives them with loadtest and reports throughput,
+latency and container CPU time per request (read from the container's
+cgroup). Platforms the host can neither run natively nor through QEMU
+binfmt handlers are skipped.
+
+Under QEMU the emulated platform is several times slower than real
+hardware, so only compare native runs: run the harness on a Graviton and on
+an x86 host with the same arguments and compare the native rows.
+
+Usage:
+    python bench_arch.py --platforms linux/amd64,linux/arm64 --duration 10
+"""
+import argparse
+import os
+import platform
+import subprocess
+
+import loadtest
+from bench_serving import wait_until_up
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVICES = {
+    'flask': (HERE, '/api/test'),
+    'nginx': (os.path.join(HERE, '..', 'Nginx-microservice'), '/nginx/'),
+}
+NATIVE = {'x86_64': 'linux/amd64', 'amd64': 'linux/amd64',
+          'aarch64': 'linux/arm64', 'arm64': 'linux/arm64'}
+QEMU_HANDLERS = {'linux/amd64': 'qemu-x86_64', 'linux/arm64': 'qemu-aarch64'}
+
+
+def docker(*args):
+    return subprocess.run(('docker',) + args, check=True, stdout=subprocess.PIPE,
+                          universal_newlines=True).stdout.strip()
+
+
+def runnable(target):
+    """Return 'native', 'qemu' or None for target on this host"""
+    if NATIVE.get(platform.machine()) == target:
+        return 'native'
+    if os.path.exists(os.path.join('/proc/sys/fs/binfmt_misc', QEMU_HANDLERS[target])):
+        return 'qemu'
+    return None
+
+
+def cpu_seconds(container):
+    """Total CPU time used by the container, from cgroup v2 or v1"""
+    stat = docker('exec', container, 'sh', '-c',
+                  'cat /sys/fs/cgroup/cpu.stat 2>/dev/null || cat /sys/fs/cgroup/cpuacct/cpuacct.usage')
+    for line in stat.splitlines():
+        if line.startswith('usage_usec'):
+            return int(line.split()[1]) / 1e6
+    return int(stat) / 1e9
+
+
+def measure(service, target, port, concurrency, duration):
+    context, path = SERVICES[service]
+    image = 'bench-arch-%s:%s' % (service, target.replace('/', '-'))
+    docker('buildx', 'build', '--platform', target, '--load', '-t', image, context)
+    # gunicorn sizes its pool from the task size, as on Fargate
+    container = docker('run', '-d', '--rm', '--platform', target, '--cpus', '1',
+                       '-e', 'TASK_CPU=1024', '-e', 'TASK_MEMORY=2048',
+                       '-p', '%d:80' % port, image)
+    try:
+        url = 'http://127.0.0.1:%d%s' % (port, path)
+        wait_until_up(url, timeout=60.0)
+        loadtest.run(url, concurrency, min(duration, 3.0))  # warm up
+        before = cpu_seconds(container)
+        result = loadtest.run(url, concurrency, duration)
+        used = cpu_seconds(container) - before
+    finally:
+        docker('stop', container)
+    requests = result['requests'] + result['errors']
+    result['cpu_us'] = used / requests * 1e6 if requests else 0.0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--platforms', default='linux/amd64,linux/arm64')
+    parser.add_argument('--services', default='flask,nginx')
+    parser.add_argument('--port', type=int, default=8200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    print('%-6s %-12s %-7s %10s %9s %9s %12s' % (
+        'image', 'platform', 'mode', 'req/s', 'p50 ms', 'p99 ms', 'cpu us/req'))
+    for service in args.services.split(','):
+        for target in args.platforms.split(','):
+            mode = runnable(target)
+            if mode is None:
+                print('%-6s %-12s skipped: no QEMU handler for %s' % (service, target, target))
+                continue
+            result = measure(service, target, args.port, args.concurrency, args.duration)
+            print('%-6s %-12s %-7s %10.1f %9.1f %9.1f %12.1f' % (
+                service, target, mode, result['rps'],
+                result['p50_ms'], result['p99_ms'], result['cpu_us']))
+
+
+if __name__ == '__main__':
+    main()
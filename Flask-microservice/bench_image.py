@@ -0,0 +1,112 @@
+"""Report image size and time-to-first-200 of the Flask image, before and after
+
+Builds the image from the working tree and from --baseline (a git revision),
+whose Dockerfile and build context both come from `git archive`, and reports
+for each:
+
+- size: uncompressed size of the image on disk
+- pull: gzip-compressed size of its layers, roughly what a task pulls
+- first 200: seconds from docker run until /healthz first answers 200 (/ for
+  revisions from before /healthz), the median of --runs cold starts
+
+Usage:
+    python bench_image.py --baseline HEAD~1 --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import tarfile
+import tempfile
+import time
+import urllib.request
+import zlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def docker(*args):
+    return subprocess.run(('docker',) + args, check=True, stdout=subprocess.PIPE,
+                          universal_newlines=True).stdout.strip()
+
+
+def build(tag, context):
+    docker('build', '-q', '-t', tag, context)
+    return tag
+
+
+def checkout(revision, directory):
+    """Extract this directory as of git revision into directory"""
+    archive = subprocess.Popen(['git', 'archive', '--format=tar', revision], cwd=HERE, stdout=subprocess.PIPE)
+    with tarfile.open(fileobj=archive.stdout, mode='r|') as tar:
+        tar.extractall(directory)
+    if archive.wait():
+        raise subprocess.CalledProcessError(archive.returncode, archive.args)
+    return directory
+
+
+def health_path(context):
+    """/healthz when the app in context has it, otherwise /"""
+    with open(os.path.join(context, 'app.py')) as app:
+        return '/healthz' if "'/healthz'" in app.read() else '/'
+
+
+def compressed_size(image):
+    """gzip-level compressed size of the image's saved layers"""
+    save = subprocess.Popen(['docker', 'save', image], stdout=subprocess.PIPE)
+    compressor = zlib.compressobj(6)
+    size = 0
+    for chunk in iter(lambda: save.stdout.read(1 << 20), b''):
+        size += len(compressor.compress(chunk))
+    size += len(compressor.flush())
+    save.wait()
+    return size
+
+
+def time_to_first_200(image, port, path, timeout=60.0):
+    """Seconds from docker run until path answers 200, or None"""
+    url = 'http://127.0.0.1:%d%s' % (port, path)
+    start = time.monotonic()
+    container = docker('run', '-d', '--rm', '-p', '%d:80' % port, image)
+    try:
+        while time.monotonic() - start < timeout:
+            try:
+                if urllib.request.urlopen(url, timeout=1).status == 200:
+                    return time.monotonic() - start
+            except OSError:
+                pass
+            time.sleep(0.05)
+        return None
+    finally:
+        docker('rm', '-f', container)
+
+
+def report(name, image, path, port, runs):
+    size = int(docker('image', 'inspect', '--format', '{{.Size}}', image))
+    timings = [time_to_first_200(image, port, path) for _ in range(runs)]
+    started = [timing for timing in timings if timing is not None]
+    first_200 = '%.2f s' % statistics.median(started) if started else 'never'
+    print('%-10s %10.1f %10.1f %12s %7d/%d' % (
+        name, size / 2.0 ** 20, compressed_size(image) / 2.0 ** 20, first_200, len(started), runs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--baseline', default='HEAD', help='git revision to compare with')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--port', type=int, default=8400)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        baseline = checkout(args.baseline, directory)
+        before = build('flask-microservice:before', baseline)
+        before_path = health_path(baseline)
+    after = build('flask-microservice:after', HERE)
+
+    print('%-10s %10s %10s %12s %9s' % ('image', 'size MiB', 'pull MiB', 'first 200', 'started'))
+    report(args.baseline, before, before_path, args.port, args.runs)
+    report('worktree', after, health_path(HERE), args.port, args.runs)
+
+
+if __name__ == '__main__':
+    main()
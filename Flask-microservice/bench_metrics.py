@@ -0,0 +1,132 @@
+"""Measure the per-request cost of the Prometheus and EMF instrumentation
+
+Times MetricsMiddleware (with the EMF writer attached) around a trivial WSGI app to isolate what the
+instrumentation itself costs, then relates that to the in-process cost of
+each Flask route with metrics disabled. The cost of moving buffered requests
+into the metrics, which the middleware's background thread pays once per
+flush, is reported separately as aggregation. Served over HTTP each request costs
+several times more than in-process, so the percentages are an upper bound.
+
+--junit writes the results as a JUnit XML report (one test case per
+measurement, its time the seconds per request) for CodeBuild test reports.
+The run fails, and so does the pipeline's Benchmarks action, when the
+instrumentation adds more than --max-overhead percent to any route. The
+ratio is measured on one host, so it holds on slower or shared build hosts
+where absolute times do not.
+
+Usage:
+    python bench_metrics.py --requests 20000 --rounds 7
+    python bench_metrics.py --junit reports/benchmark.xml --max-overhead 5
+"""
+import argparse
+import os
+import sys
+import timeit
+from xml.etree import ElementTree
+
+os.environ['METRICS_ENABLED'] = '0'
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+from werkzeug.test import EnvironBuilder
+
+import metrics
+from app import app, emf_writer
+
+PATHS = ('/api/test', '/', '/healthz')
+
+# About 1.5% per route when measured; leaves room for build host noise
+MAX_OVERHEAD_PERCENT = 5.0
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def trivial_app(environ, start_response):
+    environ[metrics.ROUTE_ENVIRON_KEY] = '/bench'
+    start_response('200 OK', [])
+    return [b'']
+
+
+def per_request_us(wsgi_app, environ, requests, rounds):
+    """Return the best mean time per request in microseconds"""
+    def call():
+        body = wsgi_app(dict(environ), start_response)
+        b''.join(body)
+        if hasattr(body, 'close'):
+            body.close()
+    return min(timeit.repeat(call, number=requests, repeat=rounds)) / requests * 1e6
+
+
+def aggregation_us(environ, requests, rounds):
+    """Return the best time per request a flush takes to record buffered requests"""
+    middleware = metrics.MetricsMiddleware(trivial_app, emf_writer, flush_interval=3600)
+    best = None
+    for _ in range(rounds):
+        for _ in range(requests):
+            middleware(dict(environ), start_response)
+        seconds = timeit.timeit(middleware.flush, number=1)
+        best = seconds if best is None else min(best, seconds)
+    return best / requests * 1e6
+
+
+def write_junit(path, results, failures=None):
+    """Write {name: microseconds per request} as a JUnit test suite
+
+    failures maps names of failed measurements to their message.
+    """
+    failures = failures or {}
+    suite = ElementTree.Element('testsuite', name='bench_metrics', tests=str(len(results)),
+                                failures=str(len(failures)))
+    for name, us in results.items():
+        case = ElementTree.SubElement(suite, 'testcase', classname='bench_metrics', name=name,
+                                      time='%.9f' % (us / 1e6))
+        if name in failures:
+            ElementTree.SubElement(case, 'failure', message=failures[name])
+        ElementTree.SubElement(case, 'system-out').text = '%.1f us/request' % us
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    ElementTree.ElementTree(suite).write(path, encoding='utf-8', xml_declaration=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=7)
+    parser.add_argument('--junit', help='also write the results to this JUnit XML file')
+    parser.add_argument('--max-overhead', type=float, default=MAX_OVERHEAD_PERCENT,
+                        help='fail when instrumentation adds more than this percent to a route')
+    args = parser.parse_args()
+
+    emf_writer.stream = open(os.devnull, 'w')
+    environ = EnvironBuilder(path='/bench').get_environ()
+    bare = per_request_us(trivial_app, environ, args.requests, args.rounds)
+    wrapped = per_request_us(metrics.MetricsMiddleware(trivial_app, emf_writer),
+                             environ, args.requests, args.rounds)
+    cost = wrapped - bare
+    aggregation = aggregation_us(environ, args.requests, args.rounds)
+    print('instrumentation: %.1f us/request' % cost)
+    print('aggregation:     %.1f us/request, off the request path' % aggregation)
+    results = {'instrumentation': cost, 'aggregation': aggregation}
+    failures = {}
+
+    print('%-10s %12s %9s' % ('path', 'flask us/req', 'overhead'))
+    for path in PATHS:
+        environ = EnvironBuilder(path=path).get_environ()
+        route = per_request_us(app.wsgi_app, environ, args.requests // 4, args.rounds)
+        overhead = cost / route * 100
+        print('%-10s %12.1f %8.1f%%' % (path, route, overhead))
+        results['GET ' + path] = route
+        if overhead > args.max_overhead:
+            failures['GET ' + path] = 'instrumentation adds %.1f%%, more than %g%%' % (overhead, args.max_overhead)
+
+    for name, message in failures.items():
+        print('REGRESSION %s: %s' % (name, message))
+    if args.junit:
+        write_junit(args.junit, results, failures)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
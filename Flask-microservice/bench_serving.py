@@ -0,0 +1,64 @@
+"""Compare connection scaling of the WSGI and ASGI serving modes on localhost
+
+Starts gunicorn once per SERVER_MODE and reports p50/p99 latency as the
+number of concurrent keep-alive clients grows.
+
+Usage:
+    python bench_serving.py --levels 1,16,64,256 --duration 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import loadtest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def wait_until_up(url, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server at %s did not come up' % url)
+
+
+def sweep(mode, port, path, levels, duration):
+    env = dict(os.environ, SERVER_MODE=mode, PORT=str(port))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py'],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        url = 'http://127.0.0.1:%d%s' % (port, path)
+        wait_until_up(url)
+        return [loadtest.run(url, level, duration) for level in levels]
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--path', default='/api/test')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--levels', default='1,16,64,256')
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(',')]
+
+    print('%-5s %8s %10s %9s %9s %7s' % ('mode', 'clients', 'req/s', 'p50 ms', 'p99 ms', 'errors'))
+    for mode in ('wsgi', 'asgi'):
+        for result in sweep(mode, args.port, args.path, levels, args.duration):
+            print('%-5s %8d %10.1f %9.1f %9.1f %7d' % (
+                mode, result['concurrency'], result['rps'],
+                result['p50_ms'], result['p99_ms'], result['errors']))
+
+
+if __name__ == '__main__':
+    main()
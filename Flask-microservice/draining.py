@@ -0,0 +1,69 @@
+"""Readiness draining on SIGTERM for both gunicorn worker types
+
+ECS sends SIGTERM and follows with SIGKILL after the container stopTimeout
+(30s). A worker first fails /readyz for DRAIN_SECONDS, long enough for the
+ALB health check (2 x 10s) to take the task out, and only then starts its
+normal graceful shutdown. The gthread workers (SERVER_MODE=wsgi) get the
+handler from gunicorn.conf.py's post_worker_init; uvicorn installs its own
+handlers once its loop starts, so SERVER_MODE=asgi runs DrainingUvicornWorker.
+
+app is imported only once a worker drains: the gunicorn master imports this
+module to load the worker class and must not create metrics before forking.
+"""
+import asyncio
+import os
+import signal
+import sys
+import threading
+
+from gunicorn.arbiter import Arbiter
+from uvicorn.main import Server
+from uvicorn.workers import UvicornWorker
+
+DRAIN_SECONDS = int(os.environ.get('DRAIN_SECONDS', '20'))
+
+
+def start_draining(exit_later):
+    """Fail /readyz from now on and call exit_later(DRAIN_SECONDS) to stop the worker
+
+    Returns False when the worker is already draining.
+    """
+    import app
+    if app.draining.is_set():
+        return False
+    app.draining.set()
+    exit_later(DRAIN_SECONDS)
+    return True
+
+
+def drain_on_sigterm(worker):
+    """Delay a gthread worker's shutdown on SIGTERM until readiness has drained"""
+    exit_handler = worker.handle_exit
+
+    def drain_then_exit(sig, frame):
+        start_draining(lambda seconds: threading.Timer(seconds, exit_handler, (sig, frame)).start())
+
+    signal.signal(signal.SIGTERM, drain_then_exit)
+
+
+class DrainingServer(Server):
+    """uvicorn server that drains readiness on SIGTERM before shutting down"""
+
+    def handle_exit(self, sig, frame):
+        if sig != signal.SIGTERM:
+            return super().handle_exit(sig, frame)
+        exit_handler = super().handle_exit
+        start_draining(lambda seconds: asyncio.get_event_loop().call_later(seconds, exit_handler, sig, frame))
+
+
+class DrainingUvicornWorker(UvicornWorker):
+    """UvicornWorker serving through DrainingServer"""
+
+    # UvicornWorker._serve of uvicorn 0.22 with the server class replaced
+    async def _serve(self):
+        self.config.app = self.wsgi
+        server = DrainingServer(config=self.config)
+        self._install_sigquit_handler()
+        await server.serve(sockets=self.sockets)
+        if not server.started:
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
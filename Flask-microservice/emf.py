@@ -0,0 +1,90 @@
+"""CloudWatch Embedded Metric Format (EMF) output for request latency
+
+Latency samples are buffered per (route, status) and written to stdout as
+EMF JSON lines, which the awslogs driver ships to CloudWatch Logs where they
+become metrics; nothing calls PutMetricData. Each line carries up to
+MAX_VALUES_PER_LINE samples as an array so CloudWatch keeps the full
+distribution (and therefore p99) while writing one line per batch rather
+than one per request.
+"""
+import atexit
+import json
+import sys
+import threading
+import time
+
+# CloudWatch accepts at most 100 values per metric in one EMF document
+MAX_VALUES_PER_LINE = 100
+
+
+class EmfWriter(object):
+    """Buffer request latencies and flush them as EMF lines
+
+    A flush happens when max_samples are buffered or flush_interval seconds
+    have passed, whichever comes first; a daemon thread covers idle periods.
+    """
+
+    def __init__(self, namespace, stream=None, flush_interval=10.0, max_samples=1000):
+        self.namespace = namespace
+        self.stream = stream
+        self.flush_interval = flush_interval
+        self.max_samples = max_samples
+        self._samples = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def record(self, route, status, seconds):
+        """Buffer one request; called from the metrics middleware"""
+        with self._lock:
+            samples = self._samples.get((route, status))
+            if samples is None:
+                samples = self._samples[(route, status)] = []
+            samples.append(seconds)
+            self._count += 1
+            full = self._count >= self.max_samples
+            start_timer = self._timer is None
+            if start_timer:
+                # Started lazily so each forked worker gets its own thread
+                self._timer = threading.Thread(target=self._flush_periodically, daemon=True)
+        if start_timer:
+            self._timer.start()
+            atexit.register(self.flush)
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered samples"""
+        with self._lock:
+            samples, self._samples, self._count = self._samples, {}, 0
+        if not samples:
+            return
+        timestamp = int(time.time() * 1000)
+        lines = []
+        for (route, status), latencies in samples.items():
+            for start in range(0, len(latencies), MAX_VALUES_PER_LINE):
+                lines.append(self._document(timestamp, route, status,
+                                            latencies[start:start + MAX_VALUES_PER_LINE]))
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write(''.join(lines))
+        stream.flush()
+
+    def _document(self, timestamp, route, status, latencies):
+        return json.dumps({
+            '_aws': {
+                'Timestamp': timestamp,
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [['Route'], ['Route', 'Status']],
+                    'Metrics': [{'Name': 'Latency', 'Unit': 'Milliseconds'}],
+                }],
+            },
+            'Route': route,
+            'Status': status,
+            'Latency': [round(seconds * 1000, 3) for seconds in latencies],
+        }, separators=(',', ':')) + '\n'
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
@@ -0,0 +1,97 @@
+"""Gunicorn configuration for the Flask microservice
+
+Worker and thread counts are derived from the Fargate task size, passed to the
+container as TASK_CPU (CPU units, 1024 = 1 vCPU) and TASK_MEMORY (MiB).
+SERVER_MODE selects the synchronous WSGI workers ("wsgi", the default) or the
+uvicorn event loop workers serving asgi:app ("asgi").
+"""
+import os
+import shutil
+
+TASK_CPU = int(os.environ.get('TASK_CPU', '256'))
+TASK_MEMORY = int(os.environ.get('TASK_MEMORY', '512'))
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+
+# Every worker writes its Prometheus samples here and the master merges them;
+# set before the workers fork so prometheus_client picks it up on import
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus-metrics')
+
+# The master serves the merged samples on this port, which only the VPC can
+# reach; the ALB and CloudFront only forward to the app port
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '9100'))
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+
+# Approximate resident size of one worker, used to cap the worker count
+WORKER_MEMORY_MIB = 64
+
+
+def worker_count(cpu_units, memory_mib):
+    """Return the number of worker processes for a task of the given size"""
+    by_cpu = max(2, int(2 * cpu_units / 1024) + 1)
+    # Keep one worker's worth of memory free for the master process
+    by_memory = max(1, memory_mib // WORKER_MEMORY_MIB - 1)
+    return min(by_cpu, by_memory)
+
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '80')
+workers = int(os.environ.get('WEB_CONCURRENCY', worker_count(TASK_CPU, TASK_MEMORY)))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+if SERVER_MODE == 'asgi':
+    # Idle keep-alive connections are held by the event loop; only requests
+    # in progress occupy one of the asgi.py thread pool slots
+    wsgi_app = 'asgi:app'
+    # uvicorn's UvicornWorker, draining readiness on SIGTERM (see draining.py)
+    worker_class = 'draining.DrainingUvicornWorker'
+elif SERVER_MODE == 'wsgi':
+    wsgi_app = 'app:app'
+    worker_class = 'gthread'
+else:
+    raise ValueError('SERVER_MODE must be "wsgi" or "asgi", got %r' % SERVER_MODE)
+
+# Keep connections open longer than the ALB idle timeout (60s) so the
+# load balancer, not the worker, is the side that closes them
+keepalive = 75
+
+# ECS sends SIGTERM and follows with SIGKILL after the container stopTimeout
+# (30s). Workers first fail /readyz for DRAIN_SECONDS (see draining.py), then
+# finish in-flight requests before graceful_timeout expires
+graceful_timeout = 28
+timeout = 30
+
+errorlog = '-'
+
+
+def on_starting(server):
+    """Start from an empty metrics directory so old workers are not counted"""
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR)
+
+
+def when_ready(server):
+    """Serve the merged metrics of all workers from the master on METRICS_PORT
+
+    Only prometheus_client is imported here: importing metrics.py would
+    create samples for the master process itself.
+    """
+    if not METRICS_ENABLED:
+        return
+    from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(METRICS_PORT, registry=registry)
+
+
+def child_exit(server, worker):
+    """Drop the live gauges of a worker that has exited"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    """Delay the WSGI worker's shutdown on SIGTERM until readiness has drained"""
+    if SERVER_MODE != 'wsgi':
+        # DrainingUvicornWorker handles SIGTERM itself once its loop starts
+        return
+    import draining
+    draining.drain_on_sigterm(worker)
@@ -0,0 +1,97 @@
+"""Minimal HTTP load generator for comparing local serving modes
+
+Clients send back to back by default; --rate paces them to a fixed total
+request rate instead.
+
+Usage:
+    python loadtest.py http://localhost:8000/api/test --concurrency 32 --duration 10
+    python loadtest.py http://localhost:8000/api/test --rate 200 --duration 30
+"""
+import argparse
+import http.client
+import random
+import threading
+import time
+import urllib.parse
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of an already sorted list"""
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+    return samples[index]
+
+
+def _client(url, deadline, latencies, errors, interval=0.0):
+    parsed = urllib.parse.urlsplit(url)
+    path = parsed.path or '/'
+    if parsed.query:
+        path += '?' + parsed.query
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=10)
+    # Spread the clients' first requests over one interval
+    scheduled = time.monotonic() - interval * random.random()
+    while time.monotonic() < deadline:
+        if interval:
+            scheduled += interval
+            time.sleep(max(0.0, scheduled - time.monotonic()))
+        start = time.monotonic()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors.append(response.status)
+            else:
+                latencies.append(time.monotonic() - start)
+            if response.getheader('Connection', '').lower() == 'close':
+                conn.close()
+        except (OSError, http.client.HTTPException):
+            errors.append(None)
+            conn.close()
+    conn.close()
+
+
+def run(url, concurrency=16, duration=10.0, rate=None):
+    """Drive url from concurrency keep-alive clients and return a summary dict
+
+    With rate, the clients together send at most rate requests per second.
+    """
+    deadline = time.monotonic() + duration
+    latencies, errors = [], []
+    interval = concurrency / float(rate) if rate else 0.0
+    threads = [threading.Thread(target=_client, args=(url, deadline, latencies, errors, interval))
+               for _ in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    latencies.sort()
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('url')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--rate', type=float, help='total requests per second')
+    args = parser.parse_args()
+    result = run(args.url, args.concurrency, args.duration, args.rate)
+    print('{url} c={concurrency}: {rps:.1f} req/s, p50 {p50_ms:.1f}ms, '
+          'p99 {p99_ms:.1f}ms, {requests} ok, {errors} errors'.format(**result))
+
+
+if __name__ == '__main__':
+    main()
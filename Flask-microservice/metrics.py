@@ -0,0 +1,152 @@
+"""Prometheus metrics for the Flask microservice
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+(prepared in gunicorn.conf.py) without coordinating with the others. The
+gunicorn master merges all workers' files at scrape time and serves them on
+METRICS_PORT, so a scrape reports the whole task. That port is reachable
+from inside the VPC only; the app itself, which the ALB and CloudFront
+expose, has no /metrics route.
+"""
+import atexit
+import collections
+import threading
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0)
+
+# Routes are labelled by their rule ("/api/<random_string>"), never the raw
+# path, so label cardinality stays bounded whatever clients request
+REQUESTS = Counter('flask_http_requests_total', 'HTTP requests handled',
+                   ['method', 'route', 'status'])
+LATENCY = Histogram('flask_http_request_duration_seconds', 'Time spent handling a request',
+                    ['route'], buckets=LATENCY_BUCKETS)
+IN_FLIGHT = Gauge('flask_http_requests_in_flight', 'Requests currently being handled',
+                  ['route'], multiprocess_mode='livesum')
+TEMPLATE_RENDER = Histogram('flask_template_render_seconds', 'Time spent rendering templates',
+                            ['template'], buckets=LATENCY_BUCKETS)
+# Lookups of the rendered index page cache in app.py, by result
+INDEX_CACHE = Counter('flask_index_cache_lookups_total', 'Rendered index page cache lookups',
+                      ['result'])
+INDEX_CACHE_HITS = INDEX_CACHE.labels('hit')
+INDEX_CACHE_MISSES = INDEX_CACHE.labels('miss')
+
+# Flask clears the request from the environ before the middleware regains
+# control, so the matched rule is copied here when routing sets it
+ROUTE_ENVIRON_KEY = 'metrics.route'
+
+
+class MetricsMiddleware(object):
+    """WSGI middleware recording request metrics around the Flask app
+
+    A request only appends its (method, route, status, seconds) to a deque
+    and keeps its environ in a dict while in flight, neither of which needs a
+    lock under the GIL. A daemon thread, started with the first request so
+    each forked worker has its own, calls flush() every flush_interval
+    seconds; only there are prometheus_client's per-value locks and the
+    emf_writer's buffer lock taken. Scrapes therefore lag by up to
+    flush_interval.
+
+    Labelled children are cached per label tuple, which skips the label
+    validation and registry lock prometheus_client takes on every labels().
+    """
+
+    def __init__(self, wsgi_app, emf_writer=None, flush_interval=1.0):
+        self.wsgi_app = wsgi_app
+        self.emf_writer = emf_writer
+        self.flush_interval = flush_interval
+        self._samples = collections.deque()
+        self._in_flight = {}
+        self._requests = {}
+        self._latency = {}
+        self._in_flight_gauges = {}
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+
+    def __call__(self, environ, start_response):
+        if self._flusher is None:
+            self._start_flusher()
+        statuses = []
+
+        def record_status(status, headers, exc_info=None):
+            statuses.append(status)
+            return start_response(status, headers, exc_info)
+
+        request_id = id(environ)
+        self._in_flight[request_id] = environ
+        start = time.perf_counter()
+        try:
+            return self.wsgi_app(environ, record_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            del self._in_flight[request_id]
+            self._samples.append((environ['REQUEST_METHOD'], environ.get(ROUTE_ENVIRON_KEY, 'unmatched'),
+                                  statuses[-1][:3] if statuses else '500', elapsed))
+
+    def flush(self):
+        """Record the buffered requests and set the in-flight gauge of every route"""
+        with self._flush_lock:
+            counts = {}
+            while self._samples:
+                method, route, status, elapsed = self._samples.popleft()
+                self._child(self._latency, LATENCY, (route,)).observe(elapsed)
+                key = (method, route, status)
+                counts[key] = counts.get(key, 0) + 1
+                if self.emf_writer is not None:
+                    self.emf_writer.record(route, status, elapsed)
+            for key, count in counts.items():
+                self._child(self._requests, REQUESTS, key).inc(count)
+
+            # Every route seen so far reports, 0 when nothing is in flight
+            in_flight = {route: 0 for route, in list(self._latency) + list(self._in_flight_gauges)}
+            for environ in list(self._in_flight.values()):
+                route = environ.get(ROUTE_ENVIRON_KEY, 'unmatched')
+                in_flight[route] = in_flight.get(route, 0) + 1
+            for route, count in in_flight.items():
+                self._child(self._in_flight_gauges, IN_FLIGHT, (route,)).set(count)
+
+    @staticmethod
+    def _child(children, metric, labels):
+        child = children.get(labels)
+        if child is None:
+            child = children[labels] = metric.labels(*labels)
+        return child
+
+    def _start_flusher(self):
+        with self._flush_lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+        atexit.register(self._flush_at_exit)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _flush_at_exit(self):
+        # emf_writer registers its own exit flush after this one, so it
+        # would run first and miss the samples moved here
+        self.flush()
+        if self.emf_writer is not None:
+            self.emf_writer.flush()
+
+
+def init_app(app, emf_writer=None, flush_interval=1.0):
+    """Instrument every request of app"""
+    class Request(app.request_class):
+        """Request that records its matched rule for MetricsMiddleware"""
+
+        @property
+        def url_rule(self):
+            return self.__dict__.get('_url_rule')
+
+        @url_rule.setter
+        def url_rule(self, rule):
+            self.__dict__['_url_rule'] = rule
+            self.environ[ROUTE_ENVIRON_KEY] = rule.rule
+
+    app.request_class = Request
+    app.wsgi_app = MetricsMiddleware(app.wsgi_app, emf_writer, flush_interval)
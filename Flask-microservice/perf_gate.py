@@ -0,0 +1,152 @@
+"""Fail a build when a running service is slower than its stored baseline
+
+Drives every --route of --url with loadtest and compares requests per
+second and p99 latency with the baseline file: the per-route median of
+the last --history passing runs. A route regresses when its throughput
+drops more than --max-rps-drop percent or its p99 grows more than
+--max-p99-increase percent (and by at least --min-p99-ms). With
+--update-baseline a passing run is appended to the baseline file. A missing
+baseline file passes and starts one.
+
+The pipeline keeps the baseline in the artifacts bucket and only reads it
+while gating: the PerfGate action runs this against the freshly built
+container with --save-run, and once the image is deployed a later action
+appends that run with --add-run. Locally it needs no AWS:
+
+    PORT=8080 gunicorn --config gunicorn.conf.py &
+    python perf_gate.py --url http://localhost:8080 --route / --route /api/perfgate \\
+        --baseline perf-baseline.json --update-baseline
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+import loadtest
+
+# Defaults tolerate the run-to-run noise of a shared build host
+MAX_RPS_DROP_PERCENT = 15.0
+MAX_P99_INCREASE_PERCENT = 25.0
+MIN_P99_INCREASE_MS = 2.0
+HISTORY = 5
+
+
+def measure(url, routes, concurrency, duration, warmup):
+    """Return {route: {'rps': ..., 'p99_ms': ..., 'errors': ...}}"""
+    results = {}
+    for route in routes:
+        loadtest.run(url + route, concurrency, warmup)
+        result = loadtest.run(url + route, concurrency, duration)
+        results[route] = {key: result[key] for key in ('rps', 'p99_ms', 'errors')}
+    return results
+
+
+def baseline_of(runs):
+    """Per-route median rps and p99 over the stored runs"""
+    routes = {}
+    for run in runs:
+        for route, result in run.items():
+            routes.setdefault(route, []).append(result)
+    return {
+        route: {
+            'rps': statistics.median(result['rps'] for result in results),
+            'p99_ms': statistics.median(result['p99_ms'] for result in results),
+        }
+        for route, results in routes.items()
+    }
+
+
+def regressions(baseline, current, max_rps_drop=MAX_RPS_DROP_PERCENT,
+                max_p99_increase=MAX_P99_INCREASE_PERCENT, min_p99_ms=MIN_P99_INCREASE_MS):
+    """Return a message per regressed metric; routes without a baseline are skipped"""
+    found = []
+    for route, result in sorted(current.items()):
+        if result['errors']:
+            found.append('%s: %d errors' % (route, result['errors']))
+        base = baseline.get(route)
+        if base is None:
+            continue
+        if result['rps'] < base['rps'] * (1 - max_rps_drop / 100.0):
+            found.append('%s: %.1f req/s is more than %g%% below the baseline %.1f req/s' % (
+                route, result['rps'], max_rps_drop, base['rps']))
+        if (result['p99_ms'] > base['p99_ms'] * (1 + max_p99_increase / 100.0)
+                and result['p99_ms'] - base['p99_ms'] >= min_p99_ms):
+            found.append('%s: p99 %.1f ms is more than %g%% above the baseline %.1f ms' % (
+                route, result['p99_ms'], max_p99_increase, base['p99_ms']))
+    return found
+
+
+def load_runs(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as baseline_file:
+        return json.load(baseline_file)['runs']
+
+
+def save_runs(path, runs, history=HISTORY):
+    with open(path, 'w') as baseline_file:
+        json.dump({'runs': runs[-history:]}, baseline_file, indent=2, sort_keys=True)
+
+
+def save_run(path, run):
+    with open(path, 'w') as run_file:
+        json.dump(run, run_file, indent=2, sort_keys=True)
+
+
+def add_run(baseline_path, run_path, history=HISTORY):
+    """Append the run saved at run_path to the baseline file"""
+    with open(run_path) as run_file:
+        run = json.load(run_file)
+    save_runs(baseline_path, load_runs(baseline_path) + [run], history)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='base URL of the running service')
+    parser.add_argument('--route', action='append', help='path to load; repeatable')
+    parser.add_argument('--baseline', required=True, help='baseline JSON file')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--save-run', help='write a passing run to this file')
+    parser.add_argument('--add-run', help='append the run saved in this file to the baseline and exit')
+    parser.add_argument('--history', type=int, default=HISTORY)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--max-rps-drop', type=float, default=MAX_RPS_DROP_PERCENT)
+    parser.add_argument('--max-p99-increase', type=float, default=MAX_P99_INCREASE_PERCENT)
+    parser.add_argument('--min-p99-ms', type=float, default=MIN_P99_INCREASE_MS)
+    args = parser.parse_args()
+
+    if args.add_run:
+        add_run(args.baseline, args.add_run, args.history)
+        return 0
+    if not args.url or not args.route:
+        parser.error('--url and --route are required unless --add-run is given')
+
+    runs = load_runs(args.baseline)
+    baseline = baseline_of(runs)
+    current = measure(args.url.rstrip('/'), args.route, args.concurrency, args.duration, args.warmup)
+
+    print('%-20s %10s %10s %10s %10s' % ('route', 'req/s', 'base', 'p99 ms', 'base'))
+    for route, result in current.items():
+        base = baseline.get(route, {'rps': float('nan'), 'p99_ms': float('nan')})
+        print('%-20s %10.1f %10.1f %10.1f %10.1f' % (
+            route, result['rps'], base['rps'], result['p99_ms'], base['p99_ms']))
+
+    found = regressions(baseline, current, args.max_rps_drop, args.max_p99_increase, args.min_p99_ms)
+    for message in found:
+        print('REGRESSION ' + message)
+    if found:
+        return 1
+    if not runs:
+        print('no baseline in %s yet; this run starts it' % args.baseline)
+    if args.save_run:
+        save_run(args.save_run, current)
+    if args.update_baseline:
+        save_runs(args.baseline, runs + [current], args.history)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""Unit test file for perf_gate.py"""
+import os
+import tempfile
+import unittest
+
+import perf_gate
+
+
+def result(rps, p99_ms, errors=0):
+    return {'rps': rps, 'p99_ms': p99_ms, 'errors': errors}
+
+
+class TestPerfGate(unittest.TestCase):
+    """Baseline comparison of the performance regression gate"""
+
+    def test_baseline_is_median(self):
+        """Test the baseline is the per-route median of the stored runs"""
+        runs = [{'/': result(100, 10)}, {'/': result(300, 30)}, {'/': result(200, 50)}]
+        self.assertEqual({'/': {'rps': 200, 'p99_ms': 30}}, perf_gate.baseline_of(runs))
+
+    def test_within_threshold_passes(self):
+        """Test noise inside the thresholds is not a regression"""
+        baseline = {'/': {'rps': 100.0, 'p99_ms': 20.0}}
+        self.assertEqual([], perf_gate.regressions(baseline, {'/': result(90, 24)}))
+
+    def test_throughput_drop(self):
+        """Test a throughput drop beyond the threshold fails"""
+        baseline = {'/': {'rps': 100.0, 'p99_ms': 20.0}}
+        found = perf_gate.regressions(baseline, {'/': result(80, 20)})
+        self.assertEqual(1, len(found))
+        self.assertIn('req/s', found[0])
+
+    def test_p99_increase(self):
+        """Test a p99 increase fails only when it is also large in absolute terms"""
+        self.assertEqual(1, len(perf_gate.regressions({'/': {'rps': 100.0, 'p99_ms': 20.0}}, {'/': result(100, 30)})))
+        self.assertEqual([], perf_gate.regressions({'/': {'rps': 100.0, 'p99_ms': 1.0}}, {'/': result(100, 2)}))
+
+    def test_errors_and_new_routes(self):
+        """Test errors always fail and routes without a baseline are skipped"""
+        self.assertEqual([], perf_gate.regressions({}, {'/new': result(1, 1000)}))
+        self.assertEqual(1, len(perf_gate.regressions({}, {'/new': result(1, 1, errors=3)})))
+
+    def test_history_is_bounded(self):
+        """Test only the last runs are kept in the baseline file"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            self.assertEqual([], perf_gate.load_runs(path))
+            perf_gate.save_runs(path, [{'/': result(rps, 1)} for rps in range(8)], history=3)
+            self.assertEqual([5, 6, 7], [run['/']['rps'] for run in perf_gate.load_runs(path)])
+
+    def test_add_saved_run(self):
+        """Test a run saved by the gate is appended to the baseline later"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            run_path = os.path.join(directory, 'run.json')
+            perf_gate.save_runs(path, [{'/': result(rps, 1)} for rps in range(3)])
+            perf_gate.save_run(run_path, {'/': result(9, 1)})
+            perf_gate.add_run(path, run_path, history=3)
+            self.assertEqual([1, 2, 9], [run['/']['rps'] for run in perf_gate.load_runs(path)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Smoke test of a running container, pointed at by SMOKE_URL
+
+Skipped unless SMOKE_URL is set; the metrics check also needs
+SMOKE_METRICS_URL, the container's METRICS_PORT, e.g.:
+    docker run -d -p 8080:80 -p 9100:9100 flask-microservice
+    SMOKE_URL=http://localhost:8080 SMOKE_METRICS_URL=http://localhost:9100 python -m pytest -q smoke_test.py
+"""
+import os
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+SMOKE_URL = os.environ.get('SMOKE_URL', '').rstrip('/')
+SMOKE_METRICS_URL = os.environ.get('SMOKE_METRICS_URL', '').rstrip('/')
+
+
+@unittest.skipUnless(SMOKE_URL, 'SMOKE_URL is not set')
+class TestSmoke(unittest.TestCase):
+    """Every route answers from the container image"""
+
+    def get(self, path, base=SMOKE_URL):
+        with urllib.request.urlopen(base + path, timeout=5) as response:
+            return response.status, response.headers, response.read().decode('utf-8')
+
+    def test_health(self):
+        """Test the liveness and readiness endpoints"""
+        for path in ('/healthz', '/readyz'):
+            with self.subTest(path=path):
+                self.assertEqual(200, self.get(path)[0])
+
+    def test_api(self):
+        """Test the reverse string endpoint"""
+        self.assertEqual((200, 'ekoms'), self.get('/api/smoke')[::2])
+
+    def test_index(self):
+        """Test the index template renders"""
+        status, headers, body = self.get('/?name=smoke')
+        self.assertEqual(200, status)
+        self.assertIn('text/html', headers['Content-Type'])
+        self.assertIn('smoke', body)
+
+    @unittest.skipUnless(SMOKE_METRICS_URL, 'SMOKE_METRICS_URL is not set')
+    def test_metrics(self):
+        """Test the metrics port reports the requests above"""
+        self.get('/api/smoke')
+        # Workers record requests every METRICS_FLUSH_SECONDS (1s)
+        deadline = time.monotonic() + 5
+        while True:
+            status, _, body = self.get('/metrics', SMOKE_METRICS_URL)
+            if 'route="/api/<random_string>"' in body or time.monotonic() > deadline:
+                break
+            time.sleep(0.2)
+        self.assertEqual(200, status)
+        self.assertIn('flask_http_requests_total{method="GET",route="/api/<random_string>",status="200"}', body)
+
+    def test_metrics_not_on_app_port(self):
+        """Test the port the ALB forwards to does not serve metrics"""
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            self.get('/metrics')
+        self.assertEqual(404, raised.exception.code)
+
+
+if __name__ == '__main__':
+    unittest.main()
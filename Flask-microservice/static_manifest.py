@@ -0,0 +1,81 @@
+"""Content-hashed names for static assets and the manifest mapping to them
+
+Every file under static/ gets a name carrying a hash of its bytes, e.g.
+static/css/bootstrap.min.css -> static/css/bootstrap.min.3f2a9c1b0e4d.css, so
+a changed file is a new URL and a published one never changes.
+tools/publish_static.py uploads the hashed copies with an immutable
+Cache-Control; the image build writes the manifest the app resolves template references through:
+
+    python static_manifest.py . static/manifest.json
+"""
+import functools
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+STATIC_DIR = 'static'
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+
+# Matches hashed names (fnmatch syntax), to tell them apart
+# from the original files in the same directories
+HASHED_PATTERN = STATIC_DIR + '/*.' + '?' * HASH_LENGTH + '.*'
+
+
+def hashed_name(relative, data):
+    """Return relative with the hash of data inserted before its extension"""
+    stem, extension = os.path.splitext(relative)
+    return '%s.%s%s' % (stem, hashlib.sha256(data).hexdigest()[:HASH_LENGTH], extension)
+
+
+def build_manifest(root):
+    """Map every file under root/static to its hashed name, both relative to root"""
+    manifest = {}
+    for directory, _, names in os.walk(os.path.join(root, STATIC_DIR)):
+        for name in names:
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            if relative == STATIC_DIR + '/' + MANIFEST_NAME:
+                continue
+            with open(path, 'rb') as asset:
+                manifest[relative] = hashed_name(relative, asset.read())
+    return manifest
+
+
+def write_manifest(root, path):
+    manifest = build_manifest(root)
+    with open(path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    return manifest
+
+
+def fingerprint(source, output):
+    """Split source into output/mutable and output/immutable
+
+    mutable/ is source as is plus static/manifest.json; immutable/ holds only
+    the hashed copies. output is replaced. Returns the manifest.
+    """
+    shutil.rmtree(output, ignore_errors=True)
+    mutable = os.path.join(output, 'mutable')
+    shutil.copytree(source, mutable)
+    manifest = write_manifest(source, os.path.join(mutable, STATIC_DIR, MANIFEST_NAME))
+    for relative, hashed in manifest.items():
+        target = os.path.join(output, 'immutable', hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(os.path.join(source, relative), target)
+    return manifest
+
+
+@functools.lru_cache(maxsize=None)
+def load_manifest(path):
+    """Read a manifest once per process; a missing one maps nothing"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+
+if __name__ == '__main__':
+    write_manifest(sys.argv[1], sys.argv[2])
@@ -40,6 +40,8 @@ flask_pipeline_stack    = FlaskPipelineStack(app, 'flask-pipeline-stack',vpc=vpc
                                             FlaskBlueGroup=alb_stack.FlaskBlueGroup,
                                             FlaskGreenGroup=alb_stack.FlaskGreenGroup,
                                             )
+# The Flask tasks read the CDN URL parameter written by the CDN stack
+flask_pipeline_stack.add_dependency(cdn_stack)
 
 
 app.synth()
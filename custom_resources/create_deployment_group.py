@@ -28,6 +28,21 @@ def handler(event, context):
         delete_deployment_group(event, context)
 
 
+def alarm_names(properties):
+    """Return the alarms that stop and roll back a deployment
+
+    BlueGroupAlarms/GreenGroupAlarms hold lists of alarm names; the single
+    BlueGroupAlarm/GreenGroupAlarm properties are still accepted.
+    """
+    names = []
+    for group in ('BlueGroup', 'GreenGroup'):
+        if group + 'Alarms' in properties:
+            names.extend(properties[group + 'Alarms'])
+        elif group + 'Alarm' in properties:
+            names.append(properties[group + 'Alarm'])
+    return names
+
+
 def create_deployment_group(event, context):
     data = {}
     status = FAILED
@@ -44,8 +59,7 @@ def create_deployment_group(event, context):
         cluster_name_ = event['ResourceProperties']['EcsClusterName']
         service_name_ = event['ResourceProperties']['EcsServiceName']
         termination_wait_time = event['ResourceProperties']['TerminationWaitTime']
-        blue_group_alarm_ = event['ResourceProperties']['BlueGroupAlarm']
-        green_group_alarm_ = event['ResourceProperties']['GreenGroupAlarm']
+        alarm_names_ = alarm_names(event['ResourceProperties'])
 
         client.create_deployment_group(
             applicationName=application_name_,
@@ -68,14 +82,7 @@ def create_deployment_group(event, context):
             alarmConfiguration={
                 'enabled': True,
                 'ignorePollAlarmFailure': False,
-                'alarms': [
-                    {
-                        'name': blue_group_alarm_
-                    },
-                    {
-                        'name': green_group_alarm_
-                    },
-                ]
+                'alarms': [{'name': name} for name in alarm_names_]
             },
             autoRollbackConfiguration={
                 'enabled': True,
@@ -148,8 +155,7 @@ def update_deployment_group(event, context):
         cluster_name_ = event['ResourceProperties']['EcsClusterName']
         service_name_ = event['ResourceProperties']['EcsServiceName']
         termination_wait_time = event['ResourceProperties']['TerminationWaitTime']
-        blue_group_alarm_ = event['ResourceProperties']['BlueGroupAlarm']
-        green_group_alarm_ = event['ResourceProperties']['GreenGroupAlarm']
+        alarm_names_ = alarm_names(event['ResourceProperties'])
 
         client.update_deployment_group(
             applicationName=application_name_,
@@ -173,14 +179,7 @@ def update_deployment_group(event, context):
             alarmConfiguration={
                 'enabled': True,
                 'ignorePollAlarmFailure': False,
-                'alarms': [
-                    {
-                        'name': blue_group_alarm_
-                    },
-                    {
-                        'name': green_group_alarm_
-                    },
-                ]
+                'alarms': [{'name': name} for name in alarm_names_]
             },
             autoRollbackConfiguration={
                 'enabled': True,
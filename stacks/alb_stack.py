@@ -45,11 +45,14 @@ class AlbStack(core.Stack):
             protocol=elbv2.ApplicationProtocol.HTTP,
             port=80,
             target_type=elbv2.TargetType.IP,
+            # Well inside the 2 minute FARGATE_SPOT interruption notice
+            deregistration_delay=core.Duration.seconds(30),
             health_check={
-                "path": "/",
-                "timeout": core.Duration.seconds(10),
-                "interval": core.Duration.seconds(15),
-                "healthy_http_codes": "200,404"
+                "path": "/healthz",
+                "timeout": core.Duration.seconds(5),
+                "interval": core.Duration.seconds(10),
+                "unhealthy_threshold_count": 2,
+                "healthy_http_codes": "200"
             }
         )
 
@@ -59,11 +62,14 @@ class AlbStack(core.Stack):
             protocol=elbv2.ApplicationProtocol.HTTP,
             port=80,
             target_type=elbv2.TargetType.IP,
+            # Well inside the 2 minute FARGATE_SPOT interruption notice
+            deregistration_delay=core.Duration.seconds(30),
             health_check={
-                "path": "/",
-                "timeout": core.Duration.seconds(10),
-                "interval": core.Duration.seconds(15),
-                "healthy_http_codes": "200,404"
+                "path": "/healthz",
+                "timeout": core.Duration.seconds(5),
+                "interval": core.Duration.seconds(10),
+                "unhealthy_threshold_count": 2,
+                "healthy_http_codes": "200"
             }
         )
 
@@ -86,11 +92,14 @@ class AlbStack(core.Stack):
             protocol=elbv2.ApplicationProtocol.HTTP,
             port=80,
             target_type=elbv2.TargetType.IP,
+            # Well inside the 2 minute FARGATE_SPOT interruption notice
+            deregistration_delay=core.Duration.seconds(30),
             health_check={
-                "path": "/api/test",
-                "timeout": core.Duration.seconds(10),
-                "interval": core.Duration.seconds(15),
-                "healthy_http_codes": "200,404"
+                "path": "/readyz",
+                "timeout": core.Duration.seconds(5),
+                "interval": core.Duration.seconds(10),
+                "unhealthy_threshold_count": 2,
+                "healthy_http_codes": "200"
             }
         )
 
@@ -100,11 +109,14 @@ class AlbStack(core.Stack):
             protocol=elbv2.ApplicationProtocol.HTTP,
             port=80,
             target_type=elbv2.TargetType.IP,
+            # Well inside the 2 minute FARGATE_SPOT interruption notice
+            deregistration_delay=core.Duration.seconds(30),
             health_check={
-                "path": "/api/test",
-                "timeout": core.Duration.seconds(10),
-                "interval": core.Duration.seconds(15),
-                "healthy_http_codes": "200,404"
+                "path": "/readyz",
+                "timeout": core.Duration.seconds(5),
+                "interval": core.Duration.seconds(10),
+                "unhealthy_threshold_count": 2,
+                "healthy_http_codes": "200"
             }
         )
 
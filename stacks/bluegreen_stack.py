@@ -16,6 +16,12 @@ from aws_cdk import (
     aws_logs
 )
 
+from stacks.cpu_architecture import build_environment, cpu_architecture, runtime_platform
+from stacks.deployment_alarms import performance_alarms
+from stacks.perf_gate import perf_baseline_project, perf_gate_project
+from stacks.service_scaling import capacity_provider_build_variables, capacity_provider_config, capacity_provider_strategies, configure_autoscaling, configure_scheduled_scaling, scaling_config, scheduled_scaling_config
+from stacks.task_size import task_size, task_size_build_variables
+
 class BlueGreen(core.Stack):
     
 
@@ -34,6 +40,13 @@ class BlueGreen(core.Stack):
         DUMMY_APP_LOG_GROUP_NAME = "/ecs/sample-Nginx-microservice"
         DUMMY_CONTAINER_IMAGE = "smuralee/nginx"
 
+        # X86_64 or ARM64 (Graviton), for the task definition and the build host
+        architecture = cpu_architecture(self, "nginx")
+        # FARGATE / FARGATE_SPOT split, shared by the service and the CodeDeploy appspec
+        capacity_providers = capacity_provider_config(self, "nginx", architecture)
+        # Task CPU units and memory, shared by the task definitions and taskdef.json
+        size = task_size(self, "nginx")
+
 
         # =============================================================================
         # ECR and CodeCommit repositories for the Blue/ Green deployment
@@ -63,6 +76,9 @@ class BlueGreen(core.Stack):
             actions=[
                 "ecr:GetAuthorizationToken",
                 "ecr:BatchCheckLayerAvailability",
+                # Pulls of the :buildcache registry cache the build reads with --cache-from
+                "ecr:GetDownloadUrlForLayer",
+                "ecr:BatchGetImage",
                 "ecr:InitiateLayerUpload",
                 "ecr:UploadLayerPart",
                 "ecr:CompleteLayerUpload",
@@ -167,14 +183,19 @@ class BlueGreen(core.Stack):
             evaluation_periods= 1
         )
 
+        # CloudWatch Alarms for p95/p99 response time and 5xx error rate, so a
+        # deployment that slows the service down is rolled back as well
+        blueGroupAlarms = [blueGroupAlarm] + performance_alarms(self, "Blue", alb, blueGroup)
+        greenGroupAlarms = [greenGroupAlarm] + performance_alarms(self, "Green", alb, greenGroup)
+
         # ================================================================================================
         # DUMMY TASK DEFINITION for the initial service creation
         # This is required for the service being made available to create the CodeDeploy Deployment Group
         # ================================================================================================
         sampleTaskDefinition = aws_ecs.FargateTaskDefinition(self, "sampleTaskDefn", 
             family= DUMMY_TASK_FAMILY_NAME,
-            cpu= 256,
-            memory_limit_mib= 1024,
+            cpu= size["cpu"],
+            memory_limit_mib= size["memory"],
             task_role= ecsTaskRole,
             execution_role= ecsTaskRole
         )
@@ -206,10 +227,11 @@ class BlueGreen(core.Stack):
         # ================================================================================================
         NginxTaskDefinition = aws_ecs.FargateTaskDefinition(self, "appTaskDefn", 
             family= ECS_TASK_FAMILY_NAME,
-            cpu= 256,
-            memory_limit_mib= 1024,
+            cpu= size["cpu"],
+            memory_limit_mib= size["memory"],
             task_role= ecsTaskRole,
-            execution_role= ecsTaskRole
+            execution_role= ecsTaskRole,
+            runtime_platform= runtime_platform(architecture)
         )
 
         NginxcontainerDefinition = NginxTaskDefinition.add_container("NginxAppContainer",
@@ -223,18 +245,22 @@ class BlueGreen(core.Stack):
             ),
             docker_labels= {
                 "name": ECS_APP_NAME
-            }
+            },
+            stop_timeout= core.Duration.seconds(30)
         )
         NginxcontainerDefinition.add_port_mappings(port_mapping)
 
         # =============================================================================
         # ECS SERVICE for the Blue/ Green deployment
         # =============================================================================
+        scaling = scaling_config(self, "nginx")
+
         NginxAppService = aws_ecs.FargateService(self, "NginxAppService",
             cluster=ecs_cluster,
             task_definition= NginxTaskDefinition,
             health_check_grace_period= core.Duration.seconds(10),
-            desired_count= 3,
+            desired_count= scaling["min_capacity"],
+            capacity_provider_strategies= capacity_provider_strategies(capacity_providers),
             deployment_controller= {
                 "type": aws_ecs.DeploymentControllerType.CODE_DEPLOY
             },
@@ -245,6 +271,11 @@ class BlueGreen(core.Stack):
         NginxAppService.connections.allow_from(alb, aws_ec2.Port.tcp(8080))
         NginxAppService.attach_to_application_target_group(blueGroup)
 
+        # Target tracking on request count per target, CPU and memory, with
+        # scheduled capacity changes around known peaks
+        scalable_task_count = configure_autoscaling(NginxAppService, scaling, [blueGroup, greenGroup])
+        configure_scheduled_scaling(scalable_task_count, scheduled_scaling_config(self, "nginx"))
+
         # =============================================================================
         # CODE DEPLOY - Deployment Group CUSTOM RESOURCE for the Blue/ Green deployment
         # =============================================================================
@@ -264,8 +295,8 @@ class BlueGreen(core.Stack):
                 "EcsClusterName": ecs_cluster.cluster_name,
                 "EcsServiceName": NginxAppService.service_name,
                 "TerminationWaitTime": ECS_TASKSET_TERMINATION_WAIT_TIME,
-                "BlueGroupAlarm": blueGroupAlarm.alarm_name,
-                "GreenGroupAlarm": greenGroupAlarm.alarm_name,
+                "BlueGroupAlarms": [alarm.alarm_name for alarm in blueGroupAlarms],
+                "GreenGroupAlarms": [alarm.alarm_name for alarm in greenGroupAlarms],
             }
         )
 
@@ -283,26 +314,26 @@ class BlueGreen(core.Stack):
         # Creating the code build project
         NginxAppcodebuild = aws_codebuild.Project(self, "NginxAppCodeBuild",
             role=codeBuildServiceRole,
-            environment=aws_codebuild.BuildEnvironment(
-                build_image=aws_codebuild.LinuxBuildImage.STANDARD_4_0,
-                compute_type=aws_codebuild.ComputeType.SMALL,
-                privileged=True,
-                environment_variables={
-                    'REPOSITORY_URI':{
-                        'value': NginxecrRepo.repository_uri,
-                        'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
-                    },
-                    'TASK_EXECUTION_ARN':{
-                        'value': ecsTaskRole.role_arn,
-                        'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
-                    },
-                    'TASK_FAMILY': {
-                        'value': ECS_TASK_FAMILY_NAME,
-                        'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
-                    }
-                }
-            ),
-            source=aws_codebuild.Source.code_commit(repository=NginxCodeCommitrepo)
+            environment=build_environment(architecture, {
+                'REPOSITORY_URI':{
+                    'value': NginxecrRepo.repository_uri,
+                    'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                },
+                'TASK_EXECUTION_ARN':{
+                    'value': ecsTaskRole.role_arn,
+                    'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                },
+                'TASK_FAMILY': {
+                    'value': ECS_TASK_FAMILY_NAME,
+                    'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                },
+                **capacity_provider_build_variables(capacity_providers),
+                **task_size_build_variables(size)
+            }),
+            source=aws_codebuild.Source.code_commit(repository=NginxCodeCommitrepo),
+            # Keeps the buildkit/binfmt images (DOCKER_LAYER) and the buildx layer
+            # cache directory listed in buildspec.yml (CUSTOM) on the build host
+            cache=aws_codebuild.Cache.local(aws_codebuild.LocalCacheMode.DOCKER_LAYER, aws_codebuild.LocalCacheMode.CUSTOM)
         )
 
 
@@ -340,6 +371,7 @@ class BlueGreen(core.Stack):
 
         sourceArtifact = codepipeline.Artifact('sourceArtifact')
         buildArtifact = codepipeline.Artifact('buildArtifact')
+        perfRunArtifact = codepipeline.Artifact('perfRunArtifact')
 
         # S3 bucket for storing the code pipeline artifacts
         NginxAppArtifactsBucket = s3.Bucket(self, "NginxAppArtifactsBucket",
@@ -375,6 +407,31 @@ class BlueGreen(core.Stack):
         NginxAppArtifactsBucket.add_to_resource_policy(denyUnEncryptedObjectUploads)
         NginxAppArtifactsBucket.add_to_resource_policy(denyInsecureConnections)
 
+        # Load tests the new image before CodeDeploy shifts any traffic to it
+        NginxAppPerfGate = perf_gate_project(self, "NginxAppPerfGate",
+            architecture= architecture,
+            source= aws_codebuild.Source.code_commit(repository=NginxCodeCommitrepo),
+            repository= NginxecrRepo,
+            artifacts_bucket= NginxAppArtifactsBucket,
+            service_key= "nginx",
+            routes= ["/nginx/"],
+            size= size
+        )
+
+        # Adds the gate's passing run to the baseline once the image is deployed
+        NginxAppPerfBaseline = perf_baseline_project(self, "NginxAppPerfBaseline",
+            artifacts_bucket= NginxAppArtifactsBucket,
+            service_key= "nginx"
+        )
+
+        NginxBuildAction = aws_codepipeline_actions.CodeBuildAction(
+            action_name= 'Build',
+            project= NginxAppcodebuild,
+            input= sourceArtifact,
+            outputs= [buildArtifact],
+            variables_namespace= 'Build'
+        )
+
         # Code Pipeline - CloudWatch trigger event is created by CDK
         codepipeline.Pipeline(self, "ecsBlueGreen", 
             role= codePipelineServiceRole,
@@ -393,11 +450,20 @@ class BlueGreen(core.Stack):
                 codepipeline.StageProps(
                     stage_name= 'Build',
                     actions= [
+                        NginxBuildAction,
+                        # Runs the image the build pushed; Deploy waits for both
                         aws_codepipeline_actions.CodeBuildAction(
-                            action_name= 'Build',
-                            project= NginxAppcodebuild,
+                            action_name= 'PerfGate',
+                            project= NginxAppPerfGate,
                             input= sourceArtifact,
-                            outputs= [buildArtifact]
+                            outputs= [perfRunArtifact],
+                            type= aws_codepipeline_actions.CodeBuildActionType.TEST,
+                            run_order= 2,
+                            environment_variables= {
+                                'IMAGE_TAG': aws_codebuild.BuildEnvironmentVariable(
+                                    value= NginxBuildAction.variable('IMAGE_TAG')
+                                )
+                            }
                         )
                     ]
                 ),
@@ -409,6 +475,13 @@ class BlueGreen(core.Stack):
                             deployment_group= ecsDeploymentGroup,
                             app_spec_template_input= buildArtifact,
                             task_definition_template_input= buildArtifact,
+                        ),
+                        # Only a deployment that succeeded moves the baseline
+                        aws_codepipeline_actions.CodeBuildAction(
+                            action_name= 'PerfBaseline',
+                            project= NginxAppPerfBaseline,
+                            input= perfRunArtifact,
+                            run_order= 2
                         )
                     ]
                 )
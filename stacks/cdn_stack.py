@@ -8,6 +8,37 @@ from aws_cdk import(
     core
 )
 
+from stacks.precompress import viewer_request_function
+
+# Values CloudFront accepts for the "cdn.http_version" context entry
+HTTP_VERSIONS = ("http1.1", "http2", "http3", "http2and3")
+
+
+def cdn_origin_config(scope: core.Construct, alb: elbv2.ApplicationLoadBalancer):
+    """Read and validate the "cdn" context entry for the ALB origin
+
+    Origin Shield defaults to the ALB's region, so every edge location reaches
+    the ALB through one regional cache and its pooled connections. The
+    keep-alive timeout stays below the ALB idle timeout (60s), after which the
+    ALB closes the connection itself.
+    """
+    config = dict(scope.node.try_get_context("cdn") or {})
+    config.setdefault("http_version", "http2and3")
+    config.setdefault("origin_keepalive_timeout", 55)
+    config.setdefault("origin_read_timeout", 30)
+    if config["http_version"] not in HTTP_VERSIONS:
+        raise ValueError('"cdn.http_version" must be one of ' + ", ".join(HTTP_VERSIONS))
+    if not 1 <= config["origin_keepalive_timeout"] <= 60:
+        raise ValueError('"cdn.origin_keepalive_timeout" must be between 1 and 60 seconds')
+    if not 1 <= config["origin_read_timeout"] <= 60:
+        raise ValueError('"cdn.origin_read_timeout" must be between 1 and 60 seconds')
+    if config.get("origin_shield", True):
+        config["origin_shield_region"] = config.get("origin_shield_region") or core.Stack.of(alb).region
+    else:
+        config["origin_shield_region"] = None
+    return config
+
+
 class CDNStack(core.Stack):
 
     def __init__(self, scope: core.Construct, id: str, s3bucket, acmcert, hostedzone,alb=elbv2.ApplicationLoadBalancer, **kwargs) -> None:
@@ -21,6 +52,52 @@ class CDNStack(core.Stack):
 
         path_patterns = ["/static/*", "/templates/*"]
 
+        origin = cdn_origin_config(self, alb)
+
+        # Serves the gzip or brotli copy tools/publish_static.py uploads instead
+        # of the original file; the rewritten URI is also the cache key
+        precompressed_function = cdn.Function(self, 'precompressed-encoding',
+            code=cdn.FunctionCode.from_inline(viewer_request_function())
+        )
+
+        # =============================================================================
+        # ALB origin caching
+        # =============================================================================
+
+        # Cache keys hold only what changes a response: the index page varies by
+        # its `name` argument, the API by path alone. How long a response is
+        # kept comes from the Flask Cache-Control headers; responses without
+        # one (default_ttl 0) are not cached
+        def alb_cache_policy(id, comment, query_string_behavior):
+            return cdn.CachePolicy(self, id,
+                comment=comment + ' on ' + env_name,
+                query_string_behavior=query_string_behavior,
+                header_behavior=cdn.CacheHeaderBehavior.none(),
+                cookie_behavior=cdn.CacheCookieBehavior.none(),
+                default_ttl=core.Duration.seconds(0),
+                min_ttl=core.Duration.seconds(0),
+                max_ttl=core.Duration.days(1),
+                enable_accept_encoding_gzip=True,
+                enable_accept_encoding_brotli=True
+            )
+
+        index_cache_policy = alb_cache_policy('alb-index-cache', 'Flask pages by path and name', cdn.CacheQueryStringBehavior.allow_list('name'))
+        alb_cache_policies = {
+            "/api/*": alb_cache_policy('alb-api-cache', 'Flask API by path', cdn.CacheQueryStringBehavior.none()),
+        }
+
+        # What the origin sees beyond the cache key: every query string for the
+        # uncached routes, the viewer's protocol and Host, but no cookies or
+        # other headers. CloudFront reaches the ALB over HTTPS and validates its
+        # certificate (test.de, *.test.de) against Host, so without it every
+        # request fails with a 502
+        alb_origin_request_policy = cdn.OriginRequestPolicy(self, 'alb-origin-request',
+            comment='Flask requests on ' + env_name,
+            query_string_behavior=cdn.OriginRequestQueryStringBehavior.all(),
+            header_behavior=cdn.OriginRequestHeaderBehavior.allow_list('Host', 'CloudFront-Forwarded-Proto'),
+            cookie_behavior=cdn.OriginRequestCookieBehavior.none()
+        )
+
         self.cdn_id = cdn.CloudFrontWebDistribution(self,'webhosting-cdn',
             origin_configs=[
                 cdn.SourceConfiguration(
@@ -34,6 +111,10 @@ class CDNStack(core.Stack):
                             path_pattern=path_pattern,
                             allowed_methods= cdn.CloudFrontAllowedMethods.ALL,
                             cached_methods= cdn.CloudFrontAllowedCachedMethods.GET_HEAD,
+                            function_associations=[cdn.FunctionAssociation(
+                                function=precompressed_function,
+                                event_type=cdn.FunctionEventType.VIEWER_REQUEST
+                            )],
                         )
                         for path_pattern in path_patterns
                     ],
@@ -41,19 +122,24 @@ class CDNStack(core.Stack):
                 cdn.SourceConfiguration(
                     custom_origin_source=cdn.CustomOriginConfig(
                         domain_name=alb.load_balancer_dns_name,
-                        origin_protocol_policy= cdn.OriginProtocolPolicy.MATCH_VIEWER
+                        origin_protocol_policy= cdn.OriginProtocolPolicy.MATCH_VIEWER,
+                        origin_keepalive_timeout= core.Duration.seconds(origin["origin_keepalive_timeout"]),
+                        origin_read_timeout= core.Duration.seconds(origin["origin_read_timeout"]),
+                        origin_shield_region= origin["origin_shield_region"]
                 ),
+                    # Cache and origin request policies are set below
                     behaviors = [ 
                         cdn.Behavior(
                             is_default_behavior=True,
                             allowed_methods= cdn.CloudFrontAllowedMethods.ALL,
-                            forwarded_values= {
-                                "query_string":True,
-                                "cookies": {"forward": "all"},
-                                "headers": ['*']
-                            },
                         )
-                    ]   
+                    ] + [
+                        cdn.Behavior(
+                            path_pattern=path_pattern,
+                            allowed_methods= cdn.CloudFrontAllowedMethods.ALL,
+                        )
+                        for path_pattern in alb_cache_policies
+                    ]
                 )
             ],
 
@@ -81,6 +167,19 @@ class CDNStack(core.Stack):
         )
 
 
+        # CloudFrontWebDistribution behaviors take no policies, so they replace
+        # the forwarded values on the ALB behaviors of the generated distribution
+        distribution = self.cdn_id.node.default_child
+        alb_behaviors = {"DefaultCacheBehavior": index_cache_policy}
+        for index, cache_policy in enumerate(alb_cache_policies.values(), len(path_patterns)):
+            alb_behaviors["CacheBehaviors." + str(index)] = cache_policy
+        # CloudFrontWebDistribution only offers http1.1 and http2
+        distribution.add_property_override("DistributionConfig.HttpVersion", origin["http_version"])
+        for behavior, cache_policy in alb_behaviors.items():
+            distribution.add_property_deletion_override("DistributionConfig." + behavior + ".ForwardedValues")
+            distribution.add_property_override("DistributionConfig." + behavior + ".CachePolicyId", cache_policy.cache_policy_id)
+            distribution.add_property_override("DistributionConfig." + behavior + ".OriginRequestPolicyId", alb_origin_request_policy.origin_request_policy_id)
+
         r53.ARecord(self, 'dev-record',
             zone=hostedzone,
             target=r53.RecordTarget.from_alias(alias_target=r53targets.CloudFrontTarget(self.cdn_id)),
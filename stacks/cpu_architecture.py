@@ -0,0 +1,60 @@
+from aws_cdk import (
+    core,
+    aws_codebuild,
+    aws_ecs,
+)
+
+# Values accepted by the "cpu_architecture" context entry of a service
+CPU_ARCHITECTURES = {
+    "X86_64": aws_ecs.CpuArchitecture.X86_64,
+    "ARM64": aws_ecs.CpuArchitecture.ARM64,
+}
+
+# Every image is pushed for both platforms whichever way the service runs,
+# so switching architecture needs no rebuild
+IMAGE_PLATFORMS = "linux/amd64,linux/arm64"
+
+
+def cpu_architecture(scope: core.Construct, service_key: str):
+    """Read and validate the "cpu_architecture" context entry of one service"""
+    architecture = (scope.node.try_get_context("cpu_architecture") or {}).get(service_key, "X86_64")
+    if architecture not in CPU_ARCHITECTURES:
+        raise ValueError('"cpu_architecture.' + service_key + '" must be one of ' + ", ".join(CPU_ARCHITECTURES))
+    return architecture
+
+
+def runtime_platform(architecture: str):
+    """Runtime platform of a Linux Fargate task definition"""
+    return aws_ecs.RuntimePlatform(
+        cpu_architecture= CPU_ARCHITECTURES[architecture],
+        operating_system_family= aws_ecs.OperatingSystemFamily.LINUX
+    )
+
+
+def build_environment(architecture: str, environment_variables):
+    """CodeBuild environment building on the same architecture as the service
+
+    The native platform builds at full speed and the other one under QEMU.
+    ARM build images only run on the large compute type.
+    """
+    if architecture == "ARM64":
+        build_image = aws_codebuild.LinuxArmBuildImage.AMAZON_LINUX_2_STANDARD_2_0
+        compute_type = aws_codebuild.ComputeType.LARGE
+    else:
+        build_image = aws_codebuild.LinuxBuildImage.STANDARD_5_0
+        compute_type = aws_codebuild.ComputeType.SMALL
+    return aws_codebuild.BuildEnvironment(
+        build_image= build_image,
+        compute_type= compute_type,
+        privileged= True,
+        environment_variables= dict(environment_variables,
+            CPU_ARCHITECTURE= {
+                'value': architecture,
+                'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+            },
+            IMAGE_PLATFORMS= {
+                'value': IMAGE_PLATFORMS,
+                'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+            }
+        )
+    )
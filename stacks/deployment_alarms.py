@@ -0,0 +1,68 @@
+from aws_cdk import (
+    core,
+    aws_cloudwatch,
+    aws_elasticloadbalancingv2 as elbv2,
+)
+
+# Thresholds for rolling back a CodeDeploy deployment on a performance regression
+P95_RESPONSE_TIME_SECONDS = 0.5
+P99_RESPONSE_TIME_SECONDS = 1.0
+TARGET_5XX_RATE_PERCENT = 1
+
+
+def performance_alarms(scope: core.Construct, prefix: str, alb: elbv2.ApplicationLoadBalancer, target_group: elbv2.ApplicationTargetGroup):
+    """Create p95/p99 TargetResponseTime and 5XX rate alarms for a target group
+
+    The alarms are named <prefix>_p95_Latency_Alarm, <prefix>_p99_Latency_Alarm
+    and <prefix>_5xx_Rate_Alarm so they can be handed to the deployment group
+    custom resource by name. Missing data (no traffic on the idle target group)
+    does not breach.
+    """
+    dimensions = {
+        "TargetGroup": target_group.target_group_full_name,
+        "LoadBalancer": alb.load_balancer_full_name
+    }
+
+    def target_metric(metric_name, statistic):
+        return aws_cloudwatch.Metric(
+            namespace= 'AWS/ApplicationELB',
+            metric_name= metric_name,
+            dimensions= dimensions,
+            statistic= statistic,
+            period= core.Duration.minutes(1)
+        )
+
+    alarms = []
+    for percentile, threshold in (("p95", P95_RESPONSE_TIME_SECONDS), ("p99", P99_RESPONSE_TIME_SECONDS)):
+        alarms.append(aws_cloudwatch.Alarm(scope, prefix + percentile + "Latency",
+            alarm_name= prefix + "_" + percentile + "_Latency_Alarm",
+            alarm_description= "CloudWatch Alarm for the " + percentile + " response time of " + prefix + " target group",
+            metric= target_metric('TargetResponseTime', percentile),
+            threshold= threshold,
+            evaluation_periods= 3,
+            datapoints_to_alarm= 2,
+            comparison_operator= aws_cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+            treat_missing_data= aws_cloudwatch.TreatMissingData.NOT_BREACHING
+        ))
+
+    error_rate = aws_cloudwatch.MathExpression(
+        expression= "IF(requests > 0, 100 * FILL(errors, 0) / requests, 0)",
+        using_metrics= {
+            "errors": target_metric('HTTPCode_Target_5XX_Count', "sum"),
+            "requests": target_metric('RequestCount', "sum")
+        },
+        label= prefix + " 5XX rate",
+        period= core.Duration.minutes(1)
+    )
+
+    alarms.append(aws_cloudwatch.Alarm(scope, prefix + "5xxRate",
+        alarm_name= prefix + "_5xx_Rate_Alarm",
+        alarm_description= "CloudWatch Alarm for the 5xx error rate (%) of " + prefix + " target group",
+        metric= error_rate,
+        threshold= TARGET_5XX_RATE_PERCENT,
+        evaluation_periods= 2,
+        comparison_operator= aws_cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+        treat_missing_data= aws_cloudwatch.TreatMissingData.NOT_BREACHING
+    ))
+
+    return alarms
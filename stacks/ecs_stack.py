@@ -16,7 +16,9 @@ class ECSStack(core.Stack):
         self.ecs_cluster = aws_ecs.Cluster(
             self, "ECSCluster",
             vpc=vpc,
-            cluster_name="Fargate-microservices"
+            cluster_name="Fargate-microservices",
+            # FARGATE for the on-demand floor, FARGATE_SPOT for cheap scale-out
+            enable_fargate_capacity_providers=True
         )
 
         # ECS Enable Cloud map
@@ -13,9 +13,19 @@ from aws_cdk import (
     aws_codepipeline_actions,
     aws_s3 as s3,
     aws_cloudwatch,
-    aws_logs
+    aws_logs,
+    aws_ssm
 )
 
+from stacks.cpu_architecture import build_environment, cpu_architecture, runtime_platform
+from stacks.deployment_alarms import performance_alarms
+from stacks.perf_gate import perf_baseline_project, perf_gate_project
+from stacks.service_scaling import capacity_provider_build_variables, capacity_provider_config, capacity_provider_strategies, configure_autoscaling, configure_scheduled_scaling, scaling_config, scheduled_scaling_config
+from stacks.task_size import task_size, task_size_build_variables
+
+# gunicorn's METRICS_PORT (see Flask-microservice/gunicorn.conf.py), also in taskdef.json
+METRICS_PORT = 9100
+
 class FlaskPipelineStack(core.Stack):
     
 
@@ -34,6 +44,15 @@ class FlaskPipelineStack(core.Stack):
         DUMMY_APP_LOG_GROUP_NAME = "/ecs/sample-Nginx-microservice"
         DUMMY_CONTAINER_IMAGE = "smuralee/nginx"
 
+        # X86_64 or ARM64 (Graviton), for the task definition and the build host
+        architecture = cpu_architecture(self, "flask")
+        # FARGATE / FARGATE_SPOT split, shared by the service and the CodeDeploy appspec
+        capacity_providers = capacity_provider_config(self, "flask", architecture)
+        # Task CPU units and memory, shared by the task definitions and taskdef.json
+        size = task_size(self, "flask")
+        # CloudFront URL written by CDNStack; templates link static assets there
+        STATIC_URL_PARAMETER = "/" + self.node.try_get_context("env") + "/app-cdn-url"
+
 
         # =============================================================================
         # ECR and CodeCommit repositories for the Blue/ Green deployment
@@ -66,7 +85,10 @@ class FlaskPipelineStack(core.Stack):
                 "ecr:InitiateLayerUpload",
                 "ecr:UploadLayerPart",
                 "ecr:CompleteLayerUpload",
-                "ecr:PutImage"
+                "ecr:PutImage",
+                "ecr:BatchGetImage",
+                "ecr:GetDownloadUrlForLayer",
+                "ecr:DescribeImages"
             ],
             resources=["*"]
         )
@@ -87,27 +109,54 @@ class FlaskPipelineStack(core.Stack):
         # Creating the code build project
         FlaskAppcodebuild = aws_codebuild.Project(self, "FlaskAppCodeBuild",
             role=FlaskcodeBuildServiceRole,
-            environment=aws_codebuild.BuildEnvironment(
-                build_image=aws_codebuild.LinuxBuildImage.STANDARD_4_0,
-                compute_type=aws_codebuild.ComputeType.SMALL,
-                privileged=True,
-                environment_variables={
-                    'REPOSITORY_URI':{
-                        'value': FlaskecrRepo.repository_uri,
-                        'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
-                    },
-                    'TASK_EXECUTION_ARN':{
-                        'value': FlaskecsTaskRole.role_arn,
+            environment=build_environment(architecture, {
+                'REPOSITORY_URI':{
+                    'value': FlaskecrRepo.repository_uri,
+                    'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                },
+                'TASK_EXECUTION_ARN':{
+                    'value': FlaskecsTaskRole.role_arn,
+                    'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                },
+                'TASK_FAMILY': {
+                    'value': ECS_TASK_FAMILY_NAME,
+                    'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                },
+                'STATIC_URL_PARAMETER': {
+                    'value': STATIC_URL_PARAMETER,
+                    'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                },
+                **capacity_provider_build_variables(capacity_providers),
+                **task_size_build_variables(size)
+            }),
+            source=aws_codebuild.Source.code_commit(repository=FlaskCodeCommitrepo),
+            # Keeps the buildkit/binfmt images (DOCKER_LAYER) and the buildx layer
+            # cache directory listed in buildspec.yml (CUSTOM) on the build host
+            cache=aws_codebuild.Cache.local(aws_codebuild.LocalCacheMode.DOCKER_LAYER, aws_codebuild.LocalCacheMode.CUSTOM)
+        )
+
+        # Test projects running one suite of buildspec_test.yml each; results
+        # land in their "report" report group
+        FlaskTestProjects = {}
+        for action_name, suite in (("UnitTests", "unit"), ("Benchmarks", "benchmark"), ("SmokeTest", "smoke")):
+            FlaskTestProjects[action_name] = aws_codebuild.Project(self, "FlaskApp" + action_name,
+                environment=build_environment(architecture, {
+                    'TEST_SUITE': {
+                        'value': suite,
                         'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
                     },
-                    'TASK_FAMILY': {
-                        'value': ECS_TASK_FAMILY_NAME,
+                    'REPOSITORY_URI': {
+                        'value': FlaskecrRepo.repository_uri,
                         'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
                     }
-                }
-            ),
-            source=aws_codebuild.Source.code_commit(repository=FlaskCodeCommitrepo)
-        )
+                }),
+                source=aws_codebuild.Source.code_commit(repository=FlaskCodeCommitrepo),
+                build_spec=aws_codebuild.BuildSpec.from_source_filename("buildspec_test.yml"),
+                cache=aws_codebuild.Cache.local(aws_codebuild.LocalCacheMode.DOCKER_LAYER)
+            )
+
+        # The smoke test runs the image the build pushed rather than building its own
+        FlaskecrRepo.grant_pull(FlaskTestProjects["SmokeTest"])
 
         # =============================================================================
         # CODE DEPLOY APPLICATION for the Blue/ Green deployment
@@ -196,16 +245,22 @@ class FlaskPipelineStack(core.Stack):
             evaluation_periods= 1
         )
 
+        # CloudWatch Alarms for p95/p99 response time and 5xx error rate, so a
+        # deployment that slows the service down is rolled back as well
+        FlaskblueGroupAlarms = [FlaskblueGroupAlarm] + performance_alarms(self, "FlaskBlue", alb, FlaskBlueGroup)
+        FlaskgreenGroupAlarms = [FlaskgreenGroupAlarm] + performance_alarms(self, "FlaskGreen", alb, FlaskGreenGroup)
+
         # ================================================================================================
         # ECS task definition using ECR image
         # Will be used by the CODE DEPLOY for  deployment
         # ================================================================================================
         FlaskTaskDefinition = aws_ecs.FargateTaskDefinition(self, "FlaskappTaskDefn", 
             family= ECS_TASK_FAMILY_NAME,
-            cpu= 256,
-            memory_limit_mib= 1024,
+            cpu= size["cpu"],
+            memory_limit_mib= size["memory"],
             task_role= FlaskecsTaskRole,
-            execution_role= FlaskecsTaskRole
+            execution_role= FlaskecsTaskRole,
+            runtime_platform= runtime_platform(architecture)
         )
 
         FlaskcontainerDefinition = FlaskTaskDefinition.add_container("FlaskAppContainer",
@@ -219,7 +274,22 @@ class FlaskPipelineStack(core.Stack):
             ),
             docker_labels= {
                 "name": ECS_APP_NAME
-            }
+            },
+            # gunicorn sizes its worker pool from the task size
+            environment= {
+                "TASK_CPU": str(size["cpu"]),
+                "TASK_MEMORY": str(size["memory"]),
+                "METRICS_PORT": str(METRICS_PORT)
+            },
+            # Read by ECS when the task starts, then once by the app
+            secrets= {
+                "STATIC_URL": aws_ecs.Secret.from_ssm_parameter(
+                    aws_ssm.StringParameter.from_string_parameter_name(self, "FlaskStaticUrl",
+                        string_parameter_name= STATIC_URL_PARAMETER
+                    )
+                )
+            },
+            stop_timeout= core.Duration.seconds(30)
         )
 
         port_mapping = aws_ecs.PortMapping(
@@ -229,14 +299,24 @@ class FlaskPipelineStack(core.Stack):
 
         FlaskcontainerDefinition.add_port_mappings(port_mapping)
 
+        # Prometheus metrics are served by the gunicorn master on their own
+        # port, which no listener or CloudFront behavior forwards to
+        FlaskcontainerDefinition.add_port_mappings(aws_ecs.PortMapping(
+            container_port=METRICS_PORT,
+            protocol=aws_ecs.Protocol.TCP
+        ))
+
         # =============================================================================
         # ECS SERVICE for the Blue/ Green deployment
         # =============================================================================
+        scaling = scaling_config(self, "flask")
+
         FlaskAppService = aws_ecs.FargateService(self, "FlaskAppService",
             cluster=ecs_cluster,
             task_definition= FlaskTaskDefinition,
             health_check_grace_period= core.Duration.seconds(10),
-            desired_count= 3,
+            desired_count= scaling["min_capacity"],
+            capacity_provider_strategies= capacity_provider_strategies(capacity_providers),
             deployment_controller= {
                 "type": aws_ecs.DeploymentControllerType.CODE_DEPLOY
             },
@@ -245,8 +325,15 @@ class FlaskPipelineStack(core.Stack):
 
         FlaskAppService.connections.allow_from(alb, aws_ec2.Port.tcp(80))
         FlaskAppService.connections.allow_from(alb, aws_ec2.Port.tcp(8080))
+        FlaskAppService.connections.allow_from(aws_ec2.Peer.ipv4(vpc.vpc_cidr_block), aws_ec2.Port.tcp(METRICS_PORT),
+            'Prometheus scrapes from inside the VPC')
         FlaskAppService.attach_to_application_target_group(FlaskBlueGroup)
 
+        # Target tracking on request count per target, CPU and memory, with
+        # scheduled capacity changes around known peaks
+        scalable_task_count = configure_autoscaling(FlaskAppService, scaling, [FlaskBlueGroup, FlaskGreenGroup])
+        configure_scheduled_scaling(scalable_task_count, scheduled_scaling_config(self, "flask"))
+
         # =============================================================================
         # CODE DEPLOY - Deployment Group CUSTOM RESOURCE for the Application deployment
         # =============================================================================
@@ -266,8 +353,8 @@ class FlaskPipelineStack(core.Stack):
                 "EcsClusterName": ecs_cluster.cluster_name,
                 "EcsServiceName": FlaskAppService.service_name,
                 "TerminationWaitTime": ECS_TASKSET_TERMINATION_WAIT_TIME,
-                "BlueGroupAlarm": FlaskblueGroupAlarm.alarm_name,
-                "GreenGroupAlarm": FlaskgreenGroupAlarm.alarm_name,
+                "BlueGroupAlarms": [alarm.alarm_name for alarm in FlaskblueGroupAlarms],
+                "GreenGroupAlarms": [alarm.alarm_name for alarm in FlaskgreenGroupAlarms],
             }
         )
 
@@ -310,6 +397,7 @@ class FlaskPipelineStack(core.Stack):
 
         sourceArtifact = codepipeline.Artifact('sourceArtifact')
         buildArtifact = codepipeline.Artifact('buildArtifact')
+        perfRunArtifact = codepipeline.Artifact('perfRunArtifact')
 
         # S3 bucket for storing the code pipeline artifacts
         FlaskAppArtifactsBucket = s3.Bucket(self, "FlaskAppArtifactsBucket",
@@ -345,6 +433,34 @@ class FlaskPipelineStack(core.Stack):
         FlaskAppArtifactsBucket.add_to_resource_policy(FlaskBucketdenyUnEncryptedObjectUploads)
         FlaskAppArtifactsBucket.add_to_resource_policy(FlaskBucketdenyInsecureConnections)
 
+        # Load tests the new image before CodeDeploy shifts any traffic to it
+        FlaskAppPerfGate = perf_gate_project(self, "FlaskAppPerfGate",
+            architecture= architecture,
+            source= aws_codebuild.Source.code_commit(repository=FlaskCodeCommitrepo),
+            repository= FlaskecrRepo,
+            artifacts_bucket= FlaskAppArtifactsBucket,
+            service_key= "flask",
+            routes= ["/", "/api/perfgate"],
+            size= size
+        )
+
+        # Adds the gate's passing run to the baseline once the image is deployed
+        FlaskAppPerfBaseline = perf_baseline_project(self, "FlaskAppPerfBaseline",
+            artifacts_bucket= FlaskAppArtifactsBucket,
+            service_key= "flask"
+        )
+
+        # The image build runs in parallel with the unit tests and benchmarks; the
+        # smoke test and perf gate follow it and run the image it pushed, tagged
+        # IMAGE_TAG. The Deploy stage only starts when all of them succeed
+        FlaskBuildAction = aws_codepipeline_actions.CodeBuildAction(
+            action_name= 'Build',
+            project= FlaskAppcodebuild,
+            input= sourceArtifact,
+            outputs= [buildArtifact],
+            variables_namespace= 'Build'
+        )
+
         # Code Pipeline - CloudWatch trigger event is created by CDK
         codepipeline.Pipeline(self, "FlaskECSPipeline", 
             role= FlaskcodePipelineServiceRole,
@@ -361,13 +477,32 @@ class FlaskPipelineStack(core.Stack):
                     ]
                 ),
                 codepipeline.StageProps(
-                    stage_name= 'Build',
-                    actions= [
+                    stage_name= 'BuildAndTest',
+                    actions= [FlaskBuildAction] + [
+                        aws_codepipeline_actions.CodeBuildAction(
+                            action_name= action_name,
+                            project= FlaskTestProjects[action_name],
+                            input= sourceArtifact,
+                            type= aws_codepipeline_actions.CodeBuildActionType.TEST
+                        )
+                        for action_name in ("UnitTests", "Benchmarks")
+                    ] + [
                         aws_codepipeline_actions.CodeBuildAction(
-                            action_name= 'Build',
-                            project= FlaskAppcodebuild,
+                            action_name= action_name,
+                            project= project,
                             input= sourceArtifact,
-                            outputs= [buildArtifact]
+                            outputs= outputs,
+                            type= aws_codepipeline_actions.CodeBuildActionType.TEST,
+                            run_order= 2,
+                            environment_variables= {
+                                'IMAGE_TAG': aws_codebuild.BuildEnvironmentVariable(
+                                    value= FlaskBuildAction.variable('IMAGE_TAG')
+                                )
+                            }
+                        )
+                        for action_name, project, outputs in (
+                            ("SmokeTest", FlaskTestProjects["SmokeTest"], None),
+                            ("PerfGate", FlaskAppPerfGate, [perfRunArtifact])
                         )
                     ]
                 ),
@@ -379,6 +514,13 @@ class FlaskPipelineStack(core.Stack):
                             deployment_group= FlaskecsDeploymentGroup,
                             app_spec_template_input= buildArtifact,
                             task_definition_template_input= buildArtifact,
+                        ),
+                        # Only a deployment that succeeded moves the baseline
+                        aws_codepipeline_actions.CodeBuildAction(
+                            action_name= 'PerfBaseline',
+                            project= FlaskAppPerfBaseline,
+                            input= perfRunArtifact,
+                            run_order= 2
                         )
                     ]
                 )
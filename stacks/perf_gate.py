@@ -0,0 +1,158 @@
+import os
+
+from aws_cdk import (
+    core,
+    aws_codebuild,
+    aws_ecr,
+    aws_iam,
+    aws_s3 as s3,
+    aws_s3_assets,
+)
+
+from stacks.cpu_architecture import build_environment
+from stacks.task_size import task_size_build_variables
+
+# perf_gate.py and the loadtest.py it drives live with the Flask service,
+# where they also run locally; the Nginx pipeline gets the same copy
+SCRIPTS_DIR = os.path.join(os.path.dirname(__file__), "..", "Flask-microservice")
+BASELINE_PREFIX = "perf-baseline/"
+# Written by the gate as its output artifact, read by the baseline update
+RUN_FILE = "perf-run.json"
+
+
+def _scripts(scope: core.Construct, id: str):
+    return aws_s3_assets.Asset(scope, id + "Scripts",
+        path= SCRIPTS_DIR,
+        exclude= ["*", ".*", "!perf_gate.py", "!loadtest.py"]
+    )
+
+
+def _baseline_uri(artifacts_bucket: s3.Bucket, service_key: str):
+    return "s3://" + artifacts_bucket.bucket_name + "/" + BASELINE_PREFIX + service_key + ".json"
+
+
+def perf_gate_project(scope: core.Construct, id: str, architecture: str, source: aws_codebuild.Source,
+                      repository: aws_ecr.IRepository, artifacts_bucket: s3.Bucket, service_key: str, routes, size):
+    """CodeBuild project load testing the freshly built image against a stored baseline
+
+    The image the build pushed to repository, selected by the IMAGE_TAG the
+    pipeline action passes in, is pulled and run with the CPU and memory of
+    one task, then perf_gate.py drives routes and fails the build on a
+    throughput or p99 regression. The project may only read the baseline,
+    perf-baseline/<service_key>.json in artifacts_bucket; a passing run is
+    its output artifact, for perf_baseline_project to add once deployed.
+    """
+    scripts = _scripts(scope, id)
+
+    project = aws_codebuild.Project(scope, id,
+        environment= build_environment(architecture, dict(task_size_build_variables(size),
+            REPOSITORY_URI= {
+                'value': repository.repository_uri,
+                'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+            },
+            SCRIPTS_URI= {
+                'value': scripts.s3_object_url,
+                'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+            },
+            BASELINE_URI= {
+                'value': _baseline_uri(artifacts_bucket, service_key),
+                'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+            },
+            ROUTES= {
+                'value': " ".join(routes),
+                'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+            }
+        )),
+        source= source,
+        build_spec= aws_codebuild.BuildSpec.from_object({
+            "version": "0.2",
+            "phases": {
+                "install": {
+                    "runtime-versions": {"python": "3.8"},
+                    "commands": [
+                        "aws s3 cp $SCRIPTS_URI /tmp/perf-gate.zip",
+                        "unzip -oq /tmp/perf-gate.zip -d /tmp/perf-gate"
+                    ]
+                },
+                "build": {
+                    "commands": [
+                        "aws ecr get-login-password | docker login --username AWS --password-stdin $REPOSITORY_URI",
+                        "docker pull $REPOSITORY_URI:$IMAGE_TAG",
+                        # Same CPU share and memory as one Fargate task
+                        "docker run -d --name perf-gate --cpus $(awk \"BEGIN {print $TASK_CPU_UNITS / 1024}\") --memory ${TASK_MEMORY_MIB}m"
+                        " -e TASK_CPU=$TASK_CPU_UNITS -e TASK_MEMORY=$TASK_MEMORY_MIB -p 8080:80 $REPOSITORY_URI:$IMAGE_TAG",
+                        "for attempt in $(seq 30); do curl -sf http://localhost:8080/healthz && break; sleep 1; done",
+                        "aws s3 cp $BASELINE_URI baseline.json || echo no stored baseline yet",
+                        "python /tmp/perf-gate/perf_gate.py --url http://localhost:8080 $(printf -- ' --route %s' $ROUTES)"
+                        " --baseline baseline.json --save-run " + RUN_FILE + " || { docker logs perf-gate; false; }"
+                    ]
+                }
+            },
+            "artifacts": {
+                "files": [RUN_FILE]
+            }
+        }),
+        cache= aws_codebuild.Cache.local(aws_codebuild.LocalCacheMode.DOCKER_LAYER)
+    )
+
+    scripts.grant_read(project)
+    repository.grant_pull(project)
+    artifacts_bucket.grant_read(project, BASELINE_PREFIX + "*")
+    # Writing the output artifact needs write access to the whole artifacts
+    # bucket, which the pipeline grants; the baseline stays off limits
+    project.add_to_role_policy(aws_iam.PolicyStatement(
+        effect= aws_iam.Effect.DENY,
+        actions= ["s3:PutObject*", "s3:DeleteObject*"],
+        resources= [artifacts_bucket.arn_for_objects(BASELINE_PREFIX + "*")]
+    ))
+    return project
+
+
+def perf_baseline_project(scope: core.Construct, id: str, artifacts_bucket: s3.Bucket, service_key: str):
+    """CodeBuild project adding the perf gate's passing run to the stored baseline
+
+    Runs on the gate's output artifact after a successful deployment, so
+    only images that made it to production move the baseline.
+    """
+    scripts = _scripts(scope, id)
+
+    project = aws_codebuild.PipelineProject(scope, id,
+        environment= aws_codebuild.BuildEnvironment(
+            build_image= aws_codebuild.LinuxBuildImage.STANDARD_5_0,
+            compute_type= aws_codebuild.ComputeType.SMALL,
+            environment_variables= {
+                'SCRIPTS_URI': {
+                    'value': scripts.s3_object_url,
+                    'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                },
+                'BASELINE_URI': {
+                    'value': _baseline_uri(artifacts_bucket, service_key),
+                    'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+                }
+            }
+        ),
+        build_spec= aws_codebuild.BuildSpec.from_object({
+            "version": "0.2",
+            "phases": {
+                "install": {
+                    "runtime-versions": {"python": "3.8"},
+                    "commands": [
+                        "aws s3 cp $SCRIPTS_URI /tmp/perf-gate.zip",
+                        "unzip -oq /tmp/perf-gate.zip -d /tmp/perf-gate"
+                    ]
+                },
+                "build": {
+                    "commands": [
+                        "aws s3 cp $BASELINE_URI baseline.json || echo no stored baseline yet",
+                        "python /tmp/perf-gate/perf_gate.py --baseline baseline.json --add-run " + RUN_FILE,
+                        # The artifacts bucket only accepts KMS encrypted uploads
+                        "aws s3 cp baseline.json $BASELINE_URI --sse aws:kms"
+                    ]
+                }
+            }
+        })
+    )
+
+    scripts.grant_read(project)
+    artifacts_bucket.grant_read_write(project, BASELINE_PREFIX + "*")
+    return project
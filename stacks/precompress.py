@@ -0,0 +1,80 @@
+"""Gzip and brotli copies of static content, compressed once at maximum level
+
+precompress(source, output) writes three trees under output, each with the
+same relative paths as source:
+
+- identity/: every file as is
+- gzip/: gzip level 9 copies of the COMPRESSIBLE files
+- br/: brotli quality 11 copies of the COMPRESSIBLE files
+
+tools/publish_static.py uploads gzip/ and br/ under those key prefixes with
+the matching Content-Encoding, and a CloudFront function (see viewer_request_function)
+rewrites requests for compressible files to the variant the viewer accepts.
+Every compressible file gets both variants, so the rewrite never misses.
+
+Usage:
+    python -m stacks.precompress static-content build/static-content
+"""
+import gzip
+import os
+import shutil
+import sys
+
+import brotli
+
+# Text formats worth compressing; images and fonts are already compressed
+COMPRESSIBLE = ('.css', '.html', '.js', '.json', '.map', '.svg', '.txt', '.xml')
+
+ENCODINGS = {
+    # mtime=0 keeps the output, and so its published digest, stable between builds
+    'gzip': lambda data: gzip.compress(data, compresslevel=9, mtime=0),
+    'br': lambda data: brotli.compress(data, quality=11),
+}
+
+
+def precompress(source: str, output: str):
+    """Write the identity, gzip and br trees of source under output
+
+    output is replaced, so files removed from source disappear from it.
+    Returns the relative paths that got compressed variants.
+    """
+    shutil.rmtree(output, ignore_errors=True)
+    shutil.copytree(source, os.path.join(output, 'identity'))
+    compressed = []
+    for directory, _, names in os.walk(source):
+        for name in sorted(names):
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, source)
+            with open(path, 'rb') as original:
+                data = original.read()
+            for encoding, compress in ENCODINGS.items():
+                target = os.path.join(output, encoding, relative)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'wb') as variant:
+                    variant.write(compress(data))
+            compressed.append(relative)
+    return sorted(compressed)
+
+
+def viewer_request_function():
+    """CloudFront function code sending compressible requests to a precompressed variant"""
+    extensions = '|'.join(extension[1:] for extension in COMPRESSIBLE)
+    return '''function handler(event) {
+    var request = event.request;
+    var accepted = request.headers['accept-encoding'];
+    if (accepted && /\\.(%s)$/.test(request.uri)) {
+        if (/\\bbr\\b/.test(accepted.value)) {
+            request.uri = '/br' + request.uri;
+        } else if (/\\bgzip\\b/.test(accepted.value)) {
+            request.uri = '/gzip' + request.uri;
+        }
+    }
+    return request;
+}''' % extensions
+
+
+if __name__ == '__main__':
+    for relative in precompress(sys.argv[1], sys.argv[2]):
+        print(relative)
@@ -1,7 +1,6 @@
 from aws_cdk import(
     aws_s3 as s3,
     aws_ssm as ssm,
-    aws_s3_deployment as s3_deploy,
     aws_cloudfront as cfn,
     aws_iam as iam,
     core
@@ -57,11 +56,8 @@ class S3Stack(core.Stack):
         # We tell the website bucket to allow access from CloudFront
         FlaskFrontendBucket.grant_read(origin_access_identity)
 
-        s3_deploy.BucketDeployment(self, "DeployFlaskFrontendWebsite",
-            sources=[s3_deploy.Source.asset("./static-content")],
-            destination_bucket=FlaskFrontendBucket,
-           # destination_key_prefix=""
-        )
+        # Content is published by tools/publish_static.py, which uploads only
+        # changed objects and invalidates only their paths
 
         core.CfnOutput(self, 'S3FlaskFrontendExport',
             value = FlaskFrontendBucket.bucket_name,
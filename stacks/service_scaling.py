@@ -0,0 +1,227 @@
+from aws_cdk import (
+    core,
+    aws_applicationautoscaling as appscaling,
+    aws_codebuild,
+    aws_ecs,
+)
+
+SCALING_KEYS = (
+    "min_capacity",
+    "max_capacity",
+    "requests_per_target",
+    "cpu_target",
+    "memory_target",
+    "scale_in_cooldown",
+    "scale_out_cooldown",
+)
+
+
+def scaling_config(scope: core.Construct, service_key: str):
+    """Read and validate the "autoscaling" context entry of one service"""
+    config = (scope.node.try_get_context("autoscaling") or {}).get(service_key)
+    if config is None:
+        raise ValueError('missing "autoscaling.' + service_key + '" in the CDK context')
+    missing = [key for key in SCALING_KEYS if key not in config]
+    if missing:
+        raise ValueError('"autoscaling.' + service_key + '" is missing ' + ", ".join(missing))
+    if not 1 <= config["min_capacity"] <= config["max_capacity"]:
+        raise ValueError('"autoscaling.' + service_key + '" needs 1 <= min_capacity <= max_capacity')
+    return config
+
+
+def configure_autoscaling(service: aws_ecs.FargateService, config, target_groups):
+    """Attach target tracking on request count, CPU and memory to service
+
+    A request count policy is created for every target group: CodeDeploy moves
+    production traffic between the blue and green groups, and target tracking
+    only scales in when every policy agrees, so the idle group's policy never
+    shrinks the service while the active one is busy. The scale-in cooldown is
+    kept long so capacity is not removed while replacement task sets settle.
+    """
+    scaling = service.auto_scale_task_count(
+        min_capacity= config["min_capacity"],
+        max_capacity= config["max_capacity"]
+    )
+
+    scale_in_cooldown = core.Duration.seconds(config["scale_in_cooldown"])
+    scale_out_cooldown = core.Duration.seconds(config["scale_out_cooldown"])
+
+    for index, target_group in enumerate(target_groups):
+        scaling.scale_on_request_count("RequestCountScaling" + str(index + 1),
+            requests_per_target= config["requests_per_target"],
+            target_group= target_group,
+            scale_in_cooldown= scale_in_cooldown,
+            scale_out_cooldown= scale_out_cooldown
+        )
+
+    scaling.scale_on_cpu_utilization("CpuScaling",
+        target_utilization_percent= config["cpu_target"],
+        scale_in_cooldown= scale_in_cooldown,
+        scale_out_cooldown= scale_out_cooldown
+    )
+
+    scaling.scale_on_memory_utilization("MemoryScaling",
+        target_utilization_percent= config["memory_target"],
+        scale_in_cooldown= scale_in_cooldown,
+        scale_out_cooldown= scale_out_cooldown
+    )
+
+    return scaling
+
+
+# Ranges and value names of the six fields of an Application Auto Scaling
+# cron expression: minutes, hours, day-of-month, month, day-of-week, year.
+# Names stand for low, low + 1, ...
+CRON_FIELDS = (
+    ("minutes", 0, 59, ()),
+    ("hours", 0, 23, ()),
+    ("day-of-month", 1, 31, ()),
+    ("month", 1, 12, ("JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC")),
+    ("day-of-week", 1, 7, ("SUN", "MON", "TUE", "WED", "THU", "FRI", "SAT")),
+    ("year", 1970, 2199, ()),
+)
+
+
+def _cron_value(token: str, low: int, high: int, names) -> bool:
+    """Whether token is one value of a field: a number in low-high or one of names"""
+    return token in names or (token.isdigit() and low <= int(token) <= high)
+
+
+def _valid_cron_item(item: str, name: str, low: int, high: int, names) -> bool:
+    """Whether item, one comma-separated part of a field, is valid for that field
+
+    An item is "*", a value or a range "a-b", each optionally followed by a
+    step "/n". Day-of-month also takes "L", "LW" and "<day>W" (nearest
+    weekday); day-of-week takes "L", "<day>L" (last in the month) and
+    "<day>#<n>" (nth in the month).
+    """
+    if name == "day-of-month":
+        if item in ("L", "LW"):
+            return True
+        if item.endswith("W"):
+            return _cron_value(item[:-1], low, high, names)
+    if name == "day-of-week":
+        if item == "L":
+            return True
+        if item.endswith("L"):
+            return _cron_value(item[:-1], low, high, names)
+        if "#" in item:
+            day, _, nth = item.partition("#")
+            return _cron_value(day, low, high, names) and nth in ("1", "2", "3", "4", "5")
+    base, slash, step = item.partition("/")
+    if slash and not (step.isdigit() and 1 <= int(step) <= high):
+        return False
+    if base == "*":
+        return True
+    start, dash, end = base.partition("-")
+    return _cron_value(start, low, high, names) and (not dash or _cron_value(end, low, high, names))
+
+
+def validate_cron(cron: str):
+    """Raise ValueError unless cron is a valid six-field scheduled scaling cron"""
+    fields = cron.split()
+    if len(fields) != len(CRON_FIELDS):
+        raise ValueError('cron "' + cron + '" must have 6 fields: minutes hours day-of-month month day-of-week year')
+    for value, (name, low, high, names) in zip(fields, CRON_FIELDS):
+        if value == "?" and name in ("day-of-month", "day-of-week"):
+            continue
+        for item in value.split(","):
+            if not _valid_cron_item(item, name, low, high, names):
+                raise ValueError('cron "' + cron + '" has an invalid ' + name + ' item "' + item + '": expected '
+                                 + 'values in ' + str(low) + '-' + str(high) + (' or ' + ",".join(names) if names else ''))
+    if (fields[2] == "?") == (fields[4] == "?"):
+        raise ValueError('cron "' + cron + '" must use "?" in exactly one of day-of-month and day-of-week')
+
+
+def scheduled_scaling_config(scope: core.Construct, service_key: str):
+    """Read and validate the "scheduled_scaling" context entries of one service"""
+    entries = (scope.node.try_get_context("scheduled_scaling") or {}).get(service_key, [])
+    names = set()
+    for entry in entries:
+        for key in ("name", "cron", "min_capacity", "max_capacity"):
+            if key not in entry:
+                raise ValueError('"scheduled_scaling.' + service_key + '" entry is missing ' + key)
+        if entry["name"] in names:
+            raise ValueError('"scheduled_scaling.' + service_key + '" repeats the name ' + entry["name"])
+        names.add(entry["name"])
+        validate_cron(entry["cron"])
+        if not 1 <= entry["min_capacity"] <= entry["max_capacity"]:
+            raise ValueError('"scheduled_scaling.' + service_key + '.' + entry["name"] + '" needs 1 <= min_capacity <= max_capacity')
+    return entries
+
+
+def configure_scheduled_scaling(scaling: aws_ecs.ScalableTaskCount, entries):
+    """Add a scheduled action per entry to change the capacity bounds
+
+    Raising min_capacity ahead of a known peak starts tasks before the reactive
+    policies would notice the load; a later entry lowers it again. The target
+    tracking policies keep operating inside whatever bounds are current.
+    Schedules are evaluated in UTC.
+    """
+    for entry in entries:
+        scaling.scale_on_schedule(entry["name"],
+            schedule= appscaling.Schedule.expression("cron(" + entry["cron"] + ")"),
+            min_capacity= entry["min_capacity"],
+            max_capacity= entry["max_capacity"]
+        )
+
+
+CAPACITY_PROVIDER_KEYS = ("on_demand_base", "on_demand_weight", "spot_weight")
+
+
+def capacity_provider_config(scope: core.Construct, service_key: str, cpu_architecture: str = "X86_64"):
+    """Read and validate the "capacity_providers" context entry of one service
+
+    FARGATE_SPOT does not run ARM64 tasks, so an ARM64 service must have a
+    spot_weight of 0.
+    """
+    config = (scope.node.try_get_context("capacity_providers") or {}).get(service_key)
+    if config is None:
+        raise ValueError('missing "capacity_providers.' + service_key + '" in the CDK context')
+    for key in CAPACITY_PROVIDER_KEYS:
+        if not isinstance(config.get(key), int) or config[key] < 0:
+            raise ValueError('"capacity_providers.' + service_key + '.' + key + '" must be a non-negative integer')
+    if config["on_demand_weight"] + config["spot_weight"] == 0:
+        raise ValueError('"capacity_providers.' + service_key + '" needs a non-zero weight')
+    if cpu_architecture == "ARM64" and config["spot_weight"]:
+        raise ValueError('"capacity_providers.' + service_key + '.spot_weight" must be 0 on ARM64, which Fargate Spot does not run')
+    return config
+
+
+def capacity_provider_strategies(config):
+    """Split a service between FARGATE and FARGATE_SPOT
+
+    on_demand_base tasks always run on FARGATE so a Spot interruption can never
+    take the service to zero; tasks beyond the base are spread
+    on_demand_weight : spot_weight between FARGATE and FARGATE_SPOT.
+    """
+    strategies = [
+        aws_ecs.CapacityProviderStrategy(
+            capacity_provider= "FARGATE",
+            base= config["on_demand_base"],
+            weight= config["on_demand_weight"]
+        )
+    ]
+    if config["spot_weight"]:
+        strategies.append(aws_ecs.CapacityProviderStrategy(
+            capacity_provider= "FARGATE_SPOT",
+            weight= config["spot_weight"]
+        ))
+    return strategies
+
+
+def capacity_provider_build_variables(config):
+    """CodeBuild environment variable substituted into appspec.yaml
+
+    CodeDeploy creates the replacement task set from the appspec, so it has to
+    carry the same strategy as the service. The value is a YAML flow sequence.
+    """
+    strategy = "{CapacityProvider: FARGATE, Base: %d, Weight: %d}" % (config["on_demand_base"], config["on_demand_weight"])
+    if config["spot_weight"]:
+        strategy += ", {CapacityProvider: FARGATE_SPOT, Base: 0, Weight: %d}" % config["spot_weight"]
+    return {
+        'CAPACITY_PROVIDER_STRATEGY': {
+            'value': "[" + strategy + "]",
+            'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+        }
+    }
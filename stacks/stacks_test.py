@@ -0,0 +1,714 @@
+"""Unit tests for the CDK stacks, run against the synthesized templates"""
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import brotli
+from aws_cdk import core
+from aws_cdk.assertions import Match, Template
+
+from stacks.alb_stack import AlbStack
+from stacks.acm_stack import ACMStack
+from stacks.bluegreen_stack import BlueGreen
+from stacks.cdn_stack import CDNStack
+from stacks.dns_stack import DNSStack
+from stacks.ecs_stack import ECSStack
+from stacks.flask_pipeline_stack import METRICS_PORT, FlaskPipelineStack
+from stacks.precompress import precompress
+from stacks.s3_stack import S3Stack
+from stacks.service_scaling import validate_cron
+from stacks.task_size import smallest_task_size
+from stacks.vpc_stack import VPCStack
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'Flask-microservice'))
+import static_manifest  # noqa: E402
+
+with open(os.path.join(os.path.dirname(__file__), '..', 'cdk.json')) as cdk_json:
+    CONTEXT = json.load(cdk_json)['context']
+
+
+def build_service_stacks(**context):
+    """Build the stacks app.py wires together for the two services"""
+    app = core.App(context=dict(CONTEXT, **context))
+    vpc_stack = VPCStack(app, 'vpc-stack')
+    ecs_stack = ECSStack(app, 'ecs-stack', vpc=vpc_stack.vpc)
+    acm_stack = ACMStack(app, 'acm-stack')
+    alb_stack = AlbStack(app, 'alb-stack', vpc=vpc_stack.vpc, acmcert=acm_stack.cert_manager_eu)
+    bluegreen_stack = BlueGreen(app, 'bluegreen-stack', vpc=vpc_stack.vpc,
+                                ecs_cluster=ecs_stack.ecs_cluster,
+                                alb=alb_stack.alb,
+                                albTestListener=alb_stack.albTestListener,
+                                albProdListener=alb_stack.albProdListener,
+                                blueGroup=alb_stack.blueGroup,
+                                greenGroup=alb_stack.greenGroup)
+    flask_pipeline_stack = FlaskPipelineStack(app, 'flask-pipeline-stack', vpc=vpc_stack.vpc,
+                                              ecs_cluster=ecs_stack.ecs_cluster,
+                                              alb=alb_stack.alb,
+                                              albTestListener=alb_stack.albTestListener,
+                                              albProdListener=alb_stack.albProdListener,
+                                              FlaskBlueGroup=alb_stack.FlaskBlueGroup,
+                                              FlaskGreenGroup=alb_stack.FlaskGreenGroup)
+    return {
+        'ecs': ecs_stack,
+        'bluegreen': bluegreen_stack,
+        'flask': flask_pipeline_stack,
+    }
+
+
+def build_cdn_stack(**context):
+    """Build the CDN stack with the stacks app.py passes it"""
+    app = core.App(context=dict(CONTEXT, **context))
+    vpc_stack = VPCStack(app, 'vpc-stack')
+    dns_stack = DNSStack(app, 'dns-stack')
+    acm_stack = ACMStack(app, 'acm-stack')
+    alb_stack = AlbStack(app, 'alb-stack', vpc=vpc_stack.vpc, acmcert=acm_stack.cert_manager_eu)
+    return CDNStack(app, 'cdn-stack', s3bucket='frontend-bucket',
+                    acmcert=acm_stack.cert_manager,
+                    hostedzone=dns_stack.hosted_zone,
+                    alb=alb_stack.alb)
+
+
+class TestDeploymentAlarms(unittest.TestCase):
+    """Deployment groups roll back on latency and 5xx regressions"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stacks = build_service_stacks()
+
+    def assertDeploymentAlarms(self, stack, blue, green):
+        template = Template.from_stack(stack)
+        for prefix in (blue, green):
+            for percentile, threshold in (("p95", 0.5), ("p99", 1.0)):
+                template.has_resource_properties("AWS::CloudWatch::Alarm", {
+                    "AlarmName": prefix + "_" + percentile + "_Latency_Alarm",
+                    "MetricName": "TargetResponseTime",
+                    "ExtendedStatistic": percentile,
+                    "Threshold": threshold,
+                    "ComparisonOperator": "GreaterThanThreshold",
+                })
+            template.has_resource_properties("AWS::CloudWatch::Alarm", {
+                "AlarmName": prefix + "_5xx_Rate_Alarm",
+                "Metrics": Match.array_with([Match.object_like({
+                    "Expression": Match.string_like_regexp("errors"),
+                })]),
+            })
+        template.has_resource_properties("AWS::CloudFormation::CustomResource", {
+            "BlueGroupAlarms": [Match.any_value()] * 4,
+            "GreenGroupAlarms": [Match.any_value()] * 4,
+        })
+
+    def test_nginx_alarms(self):
+        """Test the Nginx deployment group gets latency and error rate alarms"""
+        self.assertDeploymentAlarms(self.stacks['bluegreen'], "Blue", "Green")
+
+    def test_flask_alarms(self):
+        """Test the Flask deployment group gets latency and error rate alarms"""
+        self.assertDeploymentAlarms(self.stacks['flask'], "FlaskBlue", "FlaskGreen")
+
+
+class TestAutoscaling(unittest.TestCase):
+    """Services scale on request count, CPU and memory within context bounds"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stacks = build_service_stacks()
+
+    def assertScaling(self, stack, config):
+        template = Template.from_stack(stack)
+        template.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {
+            "MinCapacity": config["min_capacity"],
+            "MaxCapacity": config["max_capacity"],
+            "ScalableDimension": "ecs:service:DesiredCount",
+        })
+        policies = template.find_resources("AWS::ApplicationAutoScaling::ScalingPolicy")
+        tracking = [policy["Properties"]["TargetTrackingScalingPolicyConfiguration"] for policy in policies.values()]
+        metric_types = sorted(t["PredefinedMetricSpecification"]["PredefinedMetricType"] for t in tracking)
+        self.assertEqual(["ALBRequestCountPerTarget", "ALBRequestCountPerTarget",
+                          "ECSServiceAverageCPUUtilization", "ECSServiceAverageMemoryUtilization"], metric_types)
+        for policy in tracking:
+            self.assertEqual(config["scale_in_cooldown"], policy["ScaleInCooldown"])
+            self.assertEqual(config["scale_out_cooldown"], policy["ScaleOutCooldown"])
+
+    def test_nginx_scaling(self):
+        """Test the Nginx service scaling policies"""
+        self.assertScaling(self.stacks['bluegreen'], CONTEXT["autoscaling"]["nginx"])
+
+    def test_flask_scaling(self):
+        """Test the Flask service scaling policies"""
+        self.assertScaling(self.stacks['flask'], CONTEXT["autoscaling"]["flask"])
+
+    def test_invalid_bounds_rejected(self):
+        """Test min_capacity above max_capacity fails at synth time"""
+        autoscaling = json.loads(json.dumps(CONTEXT["autoscaling"]))
+        autoscaling["flask"]["min_capacity"] = 20
+        with self.assertRaises(ValueError):
+            build_service_stacks(autoscaling=autoscaling)
+
+
+class TestScheduledScaling(unittest.TestCase):
+    """Capacity bounds change on the cron table from the context"""
+
+    def test_scheduled_actions(self):
+        """Test every scheduled_scaling entry becomes a scheduled action"""
+        stacks = build_service_stacks()
+        template = Template.from_stack(stacks['flask'])
+        template.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {
+            "ScheduledActions": [
+                {
+                    "ScheduledActionName": entry["name"],
+                    "Schedule": "cron(" + entry["cron"] + ")",
+                    "ScalableTargetAction": {
+                        "MinCapacity": entry["min_capacity"],
+                        "MaxCapacity": entry["max_capacity"],
+                    },
+                }
+                for entry in CONTEXT["scheduled_scaling"]["flask"]
+            ],
+        })
+
+    def test_valid_cron(self):
+        """Test accepted cron expressions"""
+        for cron in ("30 6 ? * MON-FRI *", "0/15 * * * ? *", "0 8 1 JAN,JUL ? 2030", "0 12 ? * 6#3 *",
+                     "0,30 8-18/2 L * ? *", "0 9 15W 1-6 ? 2025-2030", "0 9 ? * 6L *", "*/5 * ? * 2,4,SAT *"):
+            with self.subTest(cron=cron):
+                validate_cron(cron)
+
+    def test_invalid_cron(self):
+        """Test rejected cron expressions"""
+        for cron in ("0 7 * * MON-FRI", "0 25 ? * * *", "0 7 * * * *", "0 7 ? * ? *", "0 7 ? * MON-FRI% *",
+                     "0 7 ? * FOO-BAR *", "99/5 * ? * * *", "0 7 ? * 9#2 *", "0 7 ? * MON#6 *", "0/0 7 ? * * *",
+                     "0 7 ? JAN-FOO * *", "0 7 32 * ? *", "0 7 ? * MON, *", "0 7 ?,1 * ? *", "0 7 ? * * 1969"):
+            with self.subTest(cron=cron):
+                with self.assertRaises(ValueError):
+                    validate_cron(cron)
+
+    def test_invalid_entry_fails_synth(self):
+        """Test a malformed schedule fails at synth time"""
+        scheduled = {"flask": [{"name": "Peak", "cron": "0 7 * * *", "min_capacity": 6, "max_capacity": 12}]}
+        with self.assertRaises(ValueError):
+            build_service_stacks(scheduled_scaling=scheduled)
+
+
+class TestCapacityProviders(unittest.TestCase):
+    """Services run an on-demand base with the rest on Fargate Spot"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stacks = build_service_stacks()
+
+    def test_cluster_providers(self):
+        """Test the cluster is associated with FARGATE and FARGATE_SPOT"""
+        template = Template.from_stack(self.stacks['ecs'])
+        template.has_resource_properties("AWS::ECS::ClusterCapacityProviderAssociations", {
+            "CapacityProviders": Match.array_with(["FARGATE", "FARGATE_SPOT"]),
+        })
+
+    def assertStrategy(self, stack, config):
+        template = Template.from_stack(stack)
+        template.has_resource_properties("AWS::ECS::Service", {
+            "CapacityProviderStrategy": [
+                {"CapacityProvider": "FARGATE", "Base": config["on_demand_base"], "Weight": config["on_demand_weight"]},
+                {"CapacityProvider": "FARGATE_SPOT", "Weight": config["spot_weight"]},
+            ],
+            "LaunchType": Match.absent(),
+        })
+        template.has_resource_properties("AWS::CodeBuild::Project", {
+            "Environment": {
+                "EnvironmentVariables": Match.array_with([{
+                    "Name": "CAPACITY_PROVIDER_STRATEGY",
+                    "Type": "PLAINTEXT",
+                    "Value": "[{CapacityProvider: FARGATE, Base: %d, Weight: %d}, {CapacityProvider: FARGATE_SPOT, Base: 0, Weight: %d}]" % (
+                        config["on_demand_base"], config["on_demand_weight"], config["spot_weight"]),
+                }]),
+            },
+        })
+
+    def test_nginx_strategy(self):
+        """Test the Nginx service and its build get the capacity provider split"""
+        self.assertStrategy(self.stacks['bluegreen'], CONTEXT["capacity_providers"]["nginx"])
+
+    def test_flask_strategy(self):
+        """Test the Flask service and its build get the capacity provider split"""
+        self.assertStrategy(self.stacks['flask'], CONTEXT["capacity_providers"]["flask"])
+
+    def test_invalid_weight_rejected(self):
+        """Test an all-zero weight fails at synth time"""
+        capacity_providers = json.loads(json.dumps(CONTEXT["capacity_providers"]))
+        capacity_providers["nginx"].update(on_demand_weight=0, spot_weight=0)
+        with self.assertRaises(ValueError):
+            build_service_stacks(capacity_providers=capacity_providers)
+
+
+class TestCpuArchitecture(unittest.TestCase):
+    """The cpu_architecture context switch moves a service to Graviton"""
+
+    def assertArchitecture(self, stack, architecture, build_image, compute_type):
+        template = Template.from_stack(stack)
+        template.has_resource_properties("AWS::ECS::TaskDefinition", {
+            "Family": Match.string_like_regexp("microservice"),
+            "RuntimePlatform": {"CpuArchitecture": architecture, "OperatingSystemFamily": "LINUX"},
+        })
+        template.has_resource_properties("AWS::CodeBuild::Project", {
+            "Environment": Match.object_like({
+                "Image": build_image,
+                "ComputeType": compute_type,
+                "EnvironmentVariables": Match.array_with([
+                    {"Name": "CPU_ARCHITECTURE", "Type": "PLAINTEXT", "Value": architecture},
+                    {"Name": "IMAGE_PLATFORMS", "Type": "PLAINTEXT", "Value": "linux/amd64,linux/arm64"},
+                ]),
+            }),
+        })
+
+    def test_default_x86(self):
+        """Test both services default to X86_64"""
+        stacks = build_service_stacks()
+        for key in ('bluegreen', 'flask'):
+            with self.subTest(stack=key):
+                self.assertArchitecture(stacks[key], "X86_64", "aws/codebuild/standard:5.0", "BUILD_GENERAL1_SMALL")
+
+    def test_arm64(self):
+        """Test ARM64 task definitions build on ARM and stay off Fargate Spot"""
+        capacity_providers = json.loads(json.dumps(CONTEXT["capacity_providers"]))
+        capacity_providers["flask"].update(spot_weight=0)
+        stacks = build_service_stacks(cpu_architecture={"nginx": "X86_64", "flask": "ARM64"},
+                                      capacity_providers=capacity_providers)
+        self.assertArchitecture(stacks['flask'], "ARM64", "aws/codebuild/amazonlinux2-aarch64-standard:2.0", "BUILD_GENERAL1_LARGE")
+        Template.from_stack(stacks['flask']).has_resource_properties("AWS::ECS::Service", {
+            "CapacityProviderStrategy": [
+                {"CapacityProvider": "FARGATE", "Base": CONTEXT["capacity_providers"]["flask"]["on_demand_base"],
+                 "Weight": CONTEXT["capacity_providers"]["flask"]["on_demand_weight"]},
+            ],
+        })
+        self.assertArchitecture(stacks['bluegreen'], "X86_64", "aws/codebuild/standard:5.0", "BUILD_GENERAL1_SMALL")
+
+    def test_arm64_spot_rejected(self):
+        """Test a Spot weight on an ARM64 service fails at synth time"""
+        with self.assertRaisesRegex(ValueError, 'capacity_providers.flask.spot_weight'):
+            build_service_stacks(cpu_architecture={"nginx": "X86_64", "flask": "ARM64"})
+
+    def test_invalid_architecture_rejected(self):
+        """Test an unknown architecture fails at synth time"""
+        with self.assertRaises(ValueError):
+            build_service_stacks(cpu_architecture={"nginx": "arm"})
+
+
+class TestBuildCache(unittest.TestCase):
+    """CodeBuild projects keep Docker layers between builds"""
+
+    def test_local_cache(self):
+        """Test both build projects use the Docker layer and custom local caches"""
+        stacks = build_service_stacks()
+        for key in ('bluegreen', 'flask'):
+            with self.subTest(stack=key):
+                Template.from_stack(stacks[key]).has_resource_properties("AWS::CodeBuild::Project", {
+                    "Cache": {"Type": "LOCAL", "Modes": ["LOCAL_DOCKER_LAYER_CACHE", "LOCAL_CUSTOM_CACHE"]},
+                })
+
+    def test_nginx_build_can_pull(self):
+        """Test the Nginx build role may pull the cached image as well as push"""
+        template = Template.from_stack(build_service_stacks()['bluegreen'])
+        template.has_resource_properties("AWS::IAM::Policy", {
+            "PolicyDocument": Match.object_like({"Statement": Match.array_with([Match.object_like({
+                "Action": Match.array_with(["ecr:GetDownloadUrlForLayer", "ecr:BatchGetImage", "ecr:PutImage"]),
+            })])}),
+            "Roles": [{"Ref": Match.string_like_regexp("codeBuildServiceRole")}],
+        })
+
+
+class TestFlaskPipeline(unittest.TestCase):
+    """Tests run alongside the image build and gate the deploy"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.template = Template.from_stack(build_service_stacks()['flask'])
+
+    def stages(self):
+        pipeline, = self.template.find_resources("AWS::CodePipeline::Pipeline").values()
+        return {stage["Name"]: stage["Actions"] for stage in pipeline["Properties"]["Stages"]}
+
+    def test_parallel_build_and_tests(self):
+        """Test unit tests and benchmarks run with the build, the image tests right after it"""
+        stages = self.stages()
+        self.assertEqual(["Source", "BuildAndTest", "Deploy"], list(stages))
+        actions = stages["BuildAndTest"]
+        self.assertEqual([("Build", 1), ("UnitTests", 1), ("Benchmarks", 1), ("SmokeTest", 2), ("PerfGate", 2)],
+                         [(action["Name"], action["RunOrder"]) for action in actions])
+        self.assertEqual(["Build", "Test", "Test", "Test", "Test"], [action["ActionTypeId"]["Category"] for action in actions])
+
+    def test_test_projects(self):
+        """Test each suite has a project running buildspec_test.yml"""
+        for suite in ("unit", "benchmark", "smoke"):
+            with self.subTest(suite=suite):
+                self.template.has_resource_properties("AWS::CodeBuild::Project", {
+                    "Source": Match.object_like({"BuildSpec": "buildspec_test.yml"}),
+                    "Environment": Match.object_like({
+                        "EnvironmentVariables": Match.array_with([{"Name": "TEST_SUITE", "Type": "PLAINTEXT", "Value": suite}]),
+                    }),
+                })
+
+    def test_image_tests_use_pushed_image(self):
+        """Test the smoke test and perf gate get the tag the build pushed, and only the baseline update follows the deploy"""
+        actions = {action["Name"]: action for action in self.stages()["BuildAndTest"]}
+        for name in ("SmokeTest", "PerfGate"):
+            with self.subTest(action=name):
+                variables = json.loads(actions[name]["Configuration"]["EnvironmentVariables"])
+                self.assertEqual([{"name": "IMAGE_TAG", "type": "PLAINTEXT", "value": "#{Build.IMAGE_TAG}"}], variables)
+        self.assertEqual(["Deploy", "PerfBaseline"], [action["Name"] for action in self.stages()["Deploy"]])
+
+
+class TestStaticUrl(unittest.TestCase):
+    """Flask tasks get the CloudFront URL from the CDN stack's SSM parameter"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.template = Template.from_stack(build_service_stacks()['flask'])
+
+    def test_task_definition_secret(self):
+        """Test the container reads STATIC_URL from /<env>/app-cdn-url"""
+        self.template.has_resource_properties("AWS::ECS::TaskDefinition", {
+            "Family": "Flask-microservice",
+            "ContainerDefinitions": [Match.object_like({
+                "Secrets": [{"Name": "STATIC_URL", "ValueFrom": {"Fn::Join": ["", Match.array_with([
+                    ":parameter/dev/app-cdn-url"])]}}],
+            })],
+        })
+
+    def test_taskdef_json_parameter(self):
+        """Test the build substitutes the parameter name into taskdef.json"""
+        self.template.has_resource_properties("AWS::CodeBuild::Project", {
+            "Environment": Match.object_like({
+                "EnvironmentVariables": Match.array_with([
+                    {"Name": "STATIC_URL_PARAMETER", "Type": "PLAINTEXT", "Value": "/dev/app-cdn-url"},
+                ]),
+            }),
+        })
+
+
+class TestMetricsPort(unittest.TestCase):
+    """Prometheus metrics are served on their own port, reachable from the VPC only"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.template = Template.from_stack(build_service_stacks()['flask'])
+
+    def test_container_port(self):
+        """Test the container maps the metrics port and tells gunicorn about it"""
+        self.template.has_resource_properties("AWS::ECS::TaskDefinition", {
+            "Family": "Flask-microservice",
+            "ContainerDefinitions": [Match.object_like({
+                "PortMappings": [{"ContainerPort": 80, "Protocol": "tcp"},
+                                 {"ContainerPort": METRICS_PORT, "Protocol": "tcp"}],
+                "Environment": Match.array_with([{"Name": "METRICS_PORT", "Value": str(METRICS_PORT)}]),
+            })],
+        })
+
+    def test_only_vpc_reaches_metrics(self):
+        """Test the only ingress on the metrics port is the VPC CIDR"""
+        groups = self.template.find_resources("AWS::EC2::SecurityGroup")
+        ingress = [rule for group in groups.values() for rule in group["Properties"].get("SecurityGroupIngress", [])
+                   if rule["FromPort"] == METRICS_PORT]
+        self.assertEqual(1, len(ingress))
+        self.assertIn("CidrIp", ingress[0])
+        self.assertEqual({}, self.template.find_resources("AWS::EC2::SecurityGroupIngress", {
+            "Properties": {"FromPort": METRICS_PORT}}))
+
+    def test_taskdef_json_port(self):
+        """Test the deployed taskdef.json maps the same metrics port"""
+        with open(os.path.join(os.path.dirname(__file__), '..', 'Flask-microservice', 'taskdef.json')) as taskdef:
+            container, = json.load(taskdef)["containerDefinitions"]
+        self.assertIn({"containerPort": METRICS_PORT, "protocol": "tcp"}, container["portMappings"])
+        self.assertIn({"name": "METRICS_PORT", "value": str(METRICS_PORT)}, container["environment"])
+
+
+class TestPerfGate(unittest.TestCase):
+    """Both pipelines load test the new image against a stored baseline"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stacks = build_service_stacks()
+
+    def assertPerfGate(self, stack, stage, routes, service_key):
+        template = Template.from_stack(stack)
+        pipeline, = template.find_resources("AWS::CodePipeline::Pipeline").values()
+        actions = [s["Actions"] for s in pipeline["Properties"]["Stages"] if s["Name"] == stage][0]
+        gate, = [action for action in actions if action["Name"] == "PerfGate"]
+        # Runs the image the Build action pushed, once it is pushed
+        self.assertEqual(2, gate["RunOrder"])
+        self.assertEqual([{"name": "IMAGE_TAG", "type": "PLAINTEXT", "value": "#{Build.IMAGE_TAG}"}],
+                         json.loads(gate["Configuration"]["EnvironmentVariables"]))
+        template.has_resource_properties("AWS::CodeBuild::Project", {
+            "Environment": Match.object_like({
+                "EnvironmentVariables": Match.array_with([
+                    Match.object_like({"Name": "BASELINE_URI", "Value": {"Fn::Join": ["", Match.array_with([
+                        "/perf-baseline/" + service_key + ".json"])]}}),
+                    {"Name": "ROUTES", "Type": "PLAINTEXT", "Value": routes},
+                ]),
+            }),
+        })
+
+        # The gate only reads the baseline; the action after Deploy adds its run
+        deploy = [s["Actions"] for s in pipeline["Properties"]["Stages"] if s["Name"] == "Deploy"][0]
+        self.assertEqual([("Deploy", 1), ("PerfBaseline", 2)], [(action["Name"], action["RunOrder"]) for action in deploy])
+        self.assertEqual(gate["OutputArtifacts"], deploy[1]["InputArtifacts"])
+        projects = template.find_resources("AWS::CodeBuild::Project")
+        gate_project = projects[gate["Configuration"]["ProjectName"]["Ref"]]
+        baseline_project = projects[deploy[1]["Configuration"]["ProjectName"]["Ref"]]
+        self.assertIn("--save-run", gate_project["Properties"]["Source"]["BuildSpec"])
+        self.assertNotIn("aws s3 cp baseline.json", gate_project["Properties"]["Source"]["BuildSpec"])
+        self.assertIn("--add-run", baseline_project["Properties"]["Source"]["BuildSpec"])
+        # Writing its output artifact needs bucket write access, so the gate's
+        # role explicitly may not write the baseline objects
+        self.assertIn(("Deny", "s3:PutObject*"), self.role_actions(template, gate_project))
+        self.assertIn(("Allow", "s3:PutObject*"), self.role_actions(template, baseline_project))
+        self.assertNotIn("Deny", {effect for effect, _ in self.role_actions(template, baseline_project)})
+
+    def role_actions(self, template, project):
+        role = project["Properties"]["ServiceRole"]["Fn::GetAtt"][0]
+        actions = []
+        for policy in template.find_resources("AWS::IAM::Policy").values():
+            if {"Ref": role} in policy["Properties"]["Roles"]:
+                for statement in policy["Properties"]["PolicyDocument"]["Statement"]:
+                    action = statement["Action"]
+                    actions.extend((statement["Effect"], name) for name in ([action] if isinstance(action, str) else action))
+        return actions
+
+    def test_nginx_gate(self):
+        """Test the Nginx pipeline gates on /nginx/"""
+        self.assertPerfGate(self.stacks['bluegreen'], "Build", "/nginx/", "nginx")
+
+    def test_flask_gate(self):
+        """Test the Flask pipeline gates on the index and API routes"""
+        self.assertPerfGate(self.stacks['flask'], "BuildAndTest", "/ /api/perfgate", "flask")
+
+
+class TestTaskSize(unittest.TestCase):
+    """Task CPU and memory come from the task_size context entry"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stacks = build_service_stacks()
+
+    def assertTaskSize(self, stack, family, config):
+        template = Template.from_stack(stack)
+        template.has_resource_properties("AWS::ECS::TaskDefinition", {
+            "Family": family,
+            "Cpu": str(config["cpu"]),
+            "Memory": str(config["memory"]),
+        })
+        template.has_resource_properties("AWS::CodeBuild::Project", {
+            "Environment": Match.object_like({
+                "EnvironmentVariables": Match.array_with([
+                    {"Name": "TASK_CPU_UNITS", "Type": "PLAINTEXT", "Value": str(config["cpu"])},
+                    {"Name": "TASK_MEMORY_MIB", "Type": "PLAINTEXT", "Value": str(config["memory"])},
+                ]),
+            }),
+        })
+        return template
+
+    def test_nginx_size(self):
+        """Test the Nginx task definition and build use the context size"""
+        self.assertTaskSize(self.stacks['bluegreen'], "Nginx-microservice", CONTEXT["task_size"]["nginx"])
+
+    def test_flask_size(self):
+        """Test the Flask task definition, container environment and build use the context size"""
+        config = CONTEXT["task_size"]["flask"]
+        template = self.assertTaskSize(self.stacks['flask'], "Flask-microservice", config)
+        template.has_resource_properties("AWS::ECS::TaskDefinition", {
+            "ContainerDefinitions": [Match.object_like({
+                "Environment": Match.array_with([
+                    {"Name": "TASK_CPU", "Value": str(config["cpu"])},
+                    {"Name": "TASK_MEMORY", "Value": str(config["memory"])},
+                ]),
+            })],
+        })
+
+    def test_invalid_size_rejected(self):
+        """Test a CPU/memory pair Fargate does not offer fails at synth time"""
+        with self.assertRaises(ValueError):
+            build_service_stacks(task_size=dict(CONTEXT["task_size"], flask={"cpu": 256, "memory": 4096}))
+
+    def test_smallest_task_size(self):
+        """Test the cheapest valid size covering the requested resources is picked"""
+        self.assertEqual((256, 512), smallest_task_size(100, 300))
+        self.assertEqual((512, 1024), smallest_task_size(300, 300))
+        self.assertEqual((256, 2048), smallest_task_size(200, 1500))
+        self.assertEqual((1024, 4096), smallest_task_size(1024, 3500))
+        with self.assertRaises(ValueError):
+            smallest_task_size(20000, 512)
+
+
+
+class TestPrecompress(unittest.TestCase):
+    """Static content is uploaded with gzip and brotli copies"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_variants_decompress_to_original(self):
+        """Test every variant decompresses to exactly the original bytes"""
+        source = os.path.join(os.path.dirname(__file__), '..', 'static-content')
+        output = os.path.join(self.directory, 'out')
+        compressed = precompress(source, output)
+        self.assertIn(os.path.join('static', 'css', 'bootstrap.min.css'), compressed)
+        for relative in compressed:
+            with open(os.path.join(source, relative), 'rb') as original:
+                data = original.read()
+            with open(os.path.join(output, 'gzip', relative), 'rb') as variant:
+                self.assertEqual(gzip.decompress(variant.read()), data)
+            with open(os.path.join(output, 'br', relative), 'rb') as variant:
+                self.assertEqual(brotli.decompress(variant.read()), data)
+            with open(os.path.join(output, 'identity', relative), 'rb') as identity:
+                self.assertEqual(identity.read(), data)
+
+    def test_only_text_formats_compressed(self):
+        """Test images are copied but not compressed, and stale output is removed"""
+        source = os.path.join(self.directory, 'source')
+        output = os.path.join(self.directory, 'out')
+        os.makedirs(source)
+        for name in ('site.css', 'logo.png'):
+            with open(os.path.join(source, name), 'wb') as content:
+                content.write(b'body { color: red; }' * 10)
+        os.makedirs(os.path.join(output, 'gzip'))
+        open(os.path.join(output, 'gzip', 'removed.css'), 'w').close()
+
+        self.assertEqual(precompress(source, output), ['site.css'])
+        self.assertEqual(sorted(os.listdir(os.path.join(output, 'identity'))), ['logo.png', 'site.css'])
+        self.assertEqual(os.listdir(os.path.join(output, 'gzip')), ['site.css'])
+        self.assertEqual(os.listdir(os.path.join(output, 'br')), ['site.css'])
+
+
+class TestStaticManifest(unittest.TestCase):
+    """Static assets are published under content-hashed, immutable names"""
+
+    def test_flask_links_published_names(self):
+        """Test the Flask image's manifest names exactly the hashed files uploaded"""
+        root = os.path.join(os.path.dirname(__file__), '..')
+        uploaded = static_manifest.build_manifest(os.path.join(root, 'static-content'))
+        linked = static_manifest.build_manifest(os.path.join(root, 'Flask-microservice'))
+        self.assertIn('static/css/bootstrap.min.css', uploaded)
+        self.assertEqual(uploaded, linked)
+
+    def test_content_published_separately(self):
+        """Test the bucket stack uploads no content; tools/publish_static.py does"""
+        template = Template.from_stack(S3Stack(core.App(context=CONTEXT), 's3-stack'))
+        template.resource_count_is("Custom::CDKBucketDeployment", 0)
+        template.resource_count_is("AWS::S3::Bucket", 1)
+
+    def test_fingerprint(self):
+        """Test fingerprint splits content into originals with a manifest and hashed copies"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        source = os.path.join(directory, 'source')
+        os.makedirs(os.path.join(source, 'static', 'css'))
+        os.makedirs(os.path.join(source, 'templates'))
+        with open(os.path.join(source, 'static', 'css', 'site.css'), 'wb') as asset:
+            asset.write(b'body { color: red; }')
+        open(os.path.join(source, 'templates', 'index.html'), 'w').close()
+
+        manifest = static_manifest.fingerprint(source, os.path.join(directory, 'out'))
+        hashed = manifest['static/css/site.css']
+        self.assertRegex(hashed, r'^static/css/site\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(directory, 'out', 'immutable', hashed), 'rb') as asset:
+            self.assertEqual(asset.read(), b'body { color: red; }')
+        with open(os.path.join(directory, 'out', 'mutable', 'static', 'manifest.json')) as manifest_file:
+            self.assertEqual(json.load(manifest_file), manifest)
+        self.assertTrue(os.path.exists(os.path.join(directory, 'out', 'mutable', 'templates', 'index.html')))
+        self.assertEqual(os.listdir(os.path.join(directory, 'out', 'immutable')), ['static'])
+
+
+class TestCdnCaching(unittest.TestCase):
+    """The ALB behaviors cache on explicit keys instead of forwarding everything"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.template = Template.from_stack(build_cdn_stack())
+        distribution, = cls.template.find_resources("AWS::CloudFront::Distribution").values()
+        cls.config = distribution["Properties"]["DistributionConfig"]
+
+    def cache_key(self, behavior):
+        policy = self.template.find_resources("AWS::CloudFront::CachePolicy")[behavior["CachePolicyId"]["Ref"]]
+        return policy["Properties"]["CachePolicyConfig"]["ParametersInCacheKeyAndForwardedToOrigin"]
+
+    def test_index_keyed_on_name(self):
+        """Test the default behavior caches on the name argument only"""
+        behavior = self.config["DefaultCacheBehavior"]
+        self.assertNotIn("ForwardedValues", behavior)
+        self.assertEqual(self.cache_key(behavior), {
+            "CookiesConfig": {"CookieBehavior": "none"},
+            "HeadersConfig": {"HeaderBehavior": "none"},
+            "QueryStringsConfig": {"QueryStringBehavior": "whitelist", "QueryStrings": ["name"]},
+            "EnableAcceptEncodingBrotli": True,
+            "EnableAcceptEncodingGzip": True,
+        })
+
+    def test_api_keyed_on_path(self):
+        """Test /api/* caches on the path alone"""
+        behavior, = [b for b in self.config["CacheBehaviors"] if b["PathPattern"] == "/api/*"]
+        self.assertNotIn("ForwardedValues", behavior)
+        self.assertEqual(self.cache_key(behavior)["QueryStringsConfig"], {"QueryStringBehavior": "none"})
+
+    def test_origin_request_policy(self):
+        """Test both ALB behaviors share an origin request policy forwarding Host but no cookies"""
+        api, = [b for b in self.config["CacheBehaviors"] if b["PathPattern"] == "/api/*"]
+        self.assertEqual(api["OriginRequestPolicyId"], self.config["DefaultCacheBehavior"]["OriginRequestPolicyId"])
+        self.template.has_resource_properties("AWS::CloudFront::OriginRequestPolicy", {
+            "OriginRequestPolicyConfig": Match.object_like({
+                "CookiesConfig": {"CookieBehavior": "none"},
+                "HeadersConfig": {"HeaderBehavior": "whitelist", "Headers": ["Host", "CloudFront-Forwarded-Proto"]},
+            }),
+        })
+
+    def test_no_cache_without_origin_header(self):
+        """Test responses without Cache-Control are not cached"""
+        for policy in self.template.find_resources("AWS::CloudFront::CachePolicy").values():
+            config = policy["Properties"]["CachePolicyConfig"]
+            self.assertEqual((config["DefaultTTL"], config["MinTTL"]), (0, 0))
+
+
+class TestCdnOrigin(unittest.TestCase):
+    """The ALB origin is reached through Origin Shield on tuned connections"""
+
+    def alb_origin(self, **cdn):
+        stack = build_cdn_stack(cdn=dict(CONTEXT['cdn'], **cdn))
+        distribution, = Template.from_stack(stack).find_resources("AWS::CloudFront::Distribution").values()
+        config = distribution["Properties"]["DistributionConfig"]
+        origin, = [o for o in config["Origins"] if "CustomOriginConfig" in o]
+        return config, origin
+
+    def test_defaults(self):
+        """Test Origin Shield in the ALB region, timeouts and HTTP/3 from cdk.json"""
+        config, origin = self.alb_origin()
+        self.assertEqual(config["HttpVersion"], "http2and3")
+        self.assertEqual(origin["OriginShield"], {"Enabled": True, "OriginShieldRegion": {"Ref": "AWS::Region"}})
+        self.assertEqual(origin["CustomOriginConfig"]["OriginKeepaliveTimeout"], 55)
+        self.assertEqual(origin["CustomOriginConfig"]["OriginReadTimeout"], 30)
+
+    def test_overrides(self):
+        """Test an explicit shield region and timeouts"""
+        config, origin = self.alb_origin(origin_shield_region="eu-central-1", origin_keepalive_timeout=30,
+                                         origin_read_timeout=10, http_version="http2")
+        self.assertEqual(config["HttpVersion"], "http2")
+        self.assertEqual(origin["OriginShield"]["OriginShieldRegion"], "eu-central-1")
+        self.assertEqual(origin["CustomOriginConfig"]["OriginKeepaliveTimeout"], 30)
+        self.assertEqual(origin["CustomOriginConfig"]["OriginReadTimeout"], 10)
+
+    def test_shield_disabled(self):
+        """Test origin_shield false leaves Origin Shield off"""
+        config, origin = self.alb_origin(origin_shield=False)
+        self.assertNotIn("OriginShield", origin)
+
+    def test_invalid_values_rejected(self):
+        """Test an unknown HTTP version or an out of range timeout fails synth"""
+        for cdn in ({"http_version": "http4"}, {"origin_keepalive_timeout": 120}, {"origin_read_timeout": 0}):
+            with self.subTest(cdn=cdn):
+                with self.assertRaises(ValueError):
+                    build_cdn_stack(cdn=dict(CONTEXT['cdn'], **cdn))
+
+
+if __name__ == "__main__":
+    unittest.main()
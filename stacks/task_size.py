@@ -0,0 +1,61 @@
+from aws_cdk import (
+    core,
+    aws_codebuild,
+)
+
+# Memory (MiB) Fargate accepts for each Linux task CPU size (CPU units)
+FARGATE_TASK_SIZES = {
+    256: (512, 1024, 2048),
+    512: tuple(range(1024, 4096 + 1, 1024)),
+    1024: tuple(range(2048, 8192 + 1, 1024)),
+    2048: tuple(range(4096, 16384 + 1, 1024)),
+    4096: tuple(range(8192, 30720 + 1, 1024)),
+    8192: tuple(range(16384, 61440 + 1, 4096)),
+    16384: tuple(range(32768, 122880 + 1, 8192)),
+}
+
+
+def task_size(scope: core.Construct, service_key: str):
+    """Read and validate the "task_size" context entry of one service
+
+    This is the only place task CPU and memory are set: the CDK task
+    definitions, the container TASK_CPU/TASK_MEMORY environment and the
+    taskdef.json templated by buildspec.yml all take it from here.
+    """
+    config = (scope.node.try_get_context("task_size") or {}).get(service_key)
+    if config is None:
+        raise ValueError('missing "task_size.' + service_key + '" in the CDK context')
+    if config.get("memory") not in FARGATE_TASK_SIZES.get(config.get("cpu"), ()):
+        raise ValueError('"task_size.' + service_key + '" cpu ' + str(config.get("cpu")) + ' / memory ' + str(config.get("memory")) + ' is not a valid Fargate task size')
+    return config
+
+
+def smallest_task_size(cpu_units: float, memory_mib: float):
+    """Return the cheapest valid Fargate (cpu, memory) with at least the given resources
+
+    Sizes are ranked by the Fargate price ratio of one vCPU to one GiB (about
+    9:1), so a larger CPU size only wins when it avoids a lot of memory.
+    """
+    candidates = [
+        (cpu, memory)
+        for cpu, memories in FARGATE_TASK_SIZES.items()
+        for memory in memories
+        if cpu >= cpu_units and memory >= memory_mib
+    ]
+    if not candidates:
+        raise ValueError('no Fargate task size has ' + str(cpu_units) + ' CPU units and ' + str(memory_mib) + ' MiB')
+    return min(candidates, key=lambda size: (9 * size[0] / 1024 + size[1] / 1024, size))
+
+
+def task_size_build_variables(config):
+    """CodeBuild environment variables substituted into taskdef.json"""
+    return {
+        'TASK_CPU_UNITS': {
+            'value': str(config["cpu"]),
+            'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+        },
+        'TASK_MEMORY_MIB': {
+            'value': str(config["memory"]),
+            'type': aws_codebuild.BuildEnvironmentVariableType.PLAINTEXT
+        }
+    }
@@ -0,0 +1,135 @@
+"""Benchmark the whole local request path: ALB stand-in, Nginx and Flask
+
+Starts docker-compose.yml (unless --no-up) with each service limited to the
+CPU and memory of its "task_size" context entry, then drives every --route
+through the ALB stand-in at each concurrency in --levels. Reports requests per
+second, p50/p90/p99 latency and error rate per route and level, and writes
+them with the git revision and task sizes to --output as JSON. --compare
+prints the change against an earlier output file.
+
+Usage:
+    python tools/bench_e2e.py --levels 1,8,32,128 --duration 10 --output bench-e2e.json
+    python tools/bench_e2e.py --no-up --compare bench-e2e.json --output bench-e2e-new.json
+"""
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'Flask-microservice'))
+
+import loadtest  # noqa: E402
+from bench_serving import wait_until_up  # noqa: E402
+
+CDK_JSON = os.path.join(ROOT, 'cdk.json')
+# One route per ALB rule plus the Flask routes behind the default action
+ROUTES = ('/nginx/', '/', '/api/test', '/other/')
+
+
+def compose_environment(task_sizes, port):
+    """docker-compose.yml variables limiting each service to one task"""
+    env = {'ALB_PORT': str(port)}
+    for service, size in task_sizes.items():
+        prefix = service.upper() + '_TASK_'
+        env[prefix + 'CPU_UNITS'] = str(size['cpu'])
+        env[prefix + 'CPUS'] = '%g' % (size['cpu'] / 1024.0)
+        env[prefix + 'MEMORY_MIB'] = str(size['memory'])
+    return env
+
+
+def bench(base_url, routes, levels, duration, warmup):
+    results = []
+    for route in routes:
+        loadtest.run(base_url + route, max(levels), warmup)
+        for level in levels:
+            result = loadtest.run(base_url + route, level, duration)
+            total = result['requests'] + result['errors']
+            results.append({
+                'route': route,
+                'concurrency': level,
+                'requests': result['requests'],
+                'errors': result['errors'],
+                'error_rate': result['errors'] / float(total) if total else 0.0,
+                'rps': result['rps'],
+                'p50_ms': result['p50_ms'],
+                'p90_ms': result['p90_ms'],
+                'p99_ms': result['p99_ms'],
+            })
+    return results
+
+
+def compare(previous, results):
+    """Print req/s and p99 of results next to the matching previous results"""
+    before = {(result['route'], result['concurrency']): result for result in previous['results']}
+    print('compared with %s (%s)' % (previous['revision'], previous['started']))
+    print('%-12s %8s %10s %8s %9s %8s' % ('route', 'clients', 'req/s', 'change', 'p99 ms', 'change'))
+    for result in results:
+        old = before.get((result['route'], result['concurrency']))
+        if old is None:
+            continue
+        print('%-12s %8d %10.1f %+7.1f%% %9.1f %+7.1f%%' % (
+            result['route'], result['concurrency'],
+            result['rps'], 100.0 * (result['rps'] - old['rps']) / max(old['rps'], 1e-9),
+            result['p99_ms'], 100.0 * (result['p99_ms'] - old['p99_ms']) / max(old['p99_ms'], 1e-9)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--route', action='append', help='path to load; repeatable, defaults to one per rule')
+    parser.add_argument('--levels', default='1,8,32,128')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--no-up', action='store_true', help='use the already running compose services')
+    parser.add_argument('--down', action='store_true', help='stop the compose services afterwards')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    parser.add_argument('--compare', help='earlier --output file to compare with')
+    args = parser.parse_args()
+    routes = args.route or ROUTES
+    levels = [int(level) for level in args.levels.split(',')]
+
+    with open(CDK_JSON) as cdk_json:
+        task_sizes = json.load(cdk_json)['context']['task_size']
+    compose = ['docker', 'compose', '--file', os.path.join(ROOT, 'docker-compose.yml')]
+    env = dict(os.environ, **compose_environment(task_sizes, args.port))
+    if not args.no_up:
+        subprocess.run(compose + ['up', '--detach', '--build'], check=True, env=env)
+
+    base_url = 'http://127.0.0.1:%d' % args.port
+    try:
+        for route in routes:
+            wait_until_up(base_url + route, timeout=60.0)
+        started = datetime.datetime.utcnow().isoformat() + 'Z'
+        results = bench(base_url, routes, levels, args.duration, args.warmup)
+    finally:
+        if args.down:
+            subprocess.run(compose + ['down'], check=True, env=env)
+
+    print('%-12s %8s %10s %9s %9s %9s %8s' % ('route', 'clients', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'errors'))
+    for result in results:
+        print('%-12s %8d %10.1f %9.1f %9.1f %9.1f %7.2f%%' % (
+            result['route'], result['concurrency'], result['rps'], result['p50_ms'],
+            result['p90_ms'], result['p99_ms'], 100.0 * result['error_rate']))
+
+    revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              stdout=subprocess.PIPE, universal_newlines=True).stdout.strip()
+    report = {
+        'revision': revision,
+        'started': started,
+        'duration': args.duration,
+        'task_size': task_sizes,
+        'results': results,
+    }
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(json.load(previous_file), results)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Compare requests per second of the Nginx image before and after an nginx.conf change
+
+Builds Nginx-microservice once with the working tree nginx.conf and once
+with the nginx.conf at --baseline (a git revision), runs each with the CPU
+and memory of its "task_size" context entry, and loads /nginx/ at each
+concurrency in --levels with keep-alive clients.
+
+Usage:
+    python tools/bench_nginx.py --baseline HEAD~1 --levels 16,64,256 --duration 10
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'Flask-microservice'))
+
+import loadtest  # noqa: E402
+from bench_serving import wait_until_up  # noqa: E402
+
+CDK_JSON = os.path.join(ROOT, 'cdk.json')
+NGINX_DIR = os.path.join(ROOT, 'Nginx-microservice')
+
+
+def docker(*args):
+    return subprocess.run(('docker',) + args, check=True, stdout=subprocess.PIPE,
+                          universal_newlines=True).stdout.strip()
+
+
+def build(tag, nginx_conf):
+    """Build the image with nginx_conf (bytes) in place of the working tree file"""
+    with tempfile.TemporaryDirectory() as context:
+        for name in os.listdir(NGINX_DIR):
+            path = os.path.join(NGINX_DIR, name)
+            if os.path.isfile(path):
+                shutil.copy(path, context)
+        with open(os.path.join(context, 'nginx.conf'), 'wb') as conf:
+            conf.write(nginx_conf)
+        docker('build', '-q', '-t', tag, context)
+    return tag
+
+
+def sweep(image, size, port, levels, duration):
+    container = docker('run', '-d', '--rm', '--cpus', '%g' % (size['cpu'] / 1024.0),
+                       '--memory', '%dm' % size['memory'], '-p', '%d:80' % port, image)
+    try:
+        url = 'http://127.0.0.1:%d/nginx/' % port
+        wait_until_up(url)
+        loadtest.run(url, max(levels), 3.0)  # warm up
+        return [loadtest.run(url, level, duration) for level in levels]
+    finally:
+        docker('stop', container)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--baseline', default='HEAD', help='git revision of nginx.conf to compare with')
+    parser.add_argument('--levels', default='16,64,256')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=8500)
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(',')]
+
+    with open(CDK_JSON) as cdk_json:
+        size = json.load(cdk_json)['context']['task_size']['nginx']
+    baseline = subprocess.run(['git', 'show', '%s:./nginx.conf' % args.baseline], cwd=NGINX_DIR,
+                              check=True, stdout=subprocess.PIPE).stdout
+    with open(os.path.join(NGINX_DIR, 'nginx.conf'), 'rb') as conf:
+        worktree = conf.read()
+    before = sweep(build('nginx-microservice:before', baseline), size, args.port, levels, args.duration)
+    after = sweep(build('nginx-microservice:after', worktree), size, args.port, levels, args.duration)
+
+    print('%8s %12s %12s %8s %11s %11s' % ('clients', 'before req/s', 'after req/s', 'change',
+                                           'before p99', 'after p99'))
+    for old, new in zip(before, after):
+        print('%8d %12.1f %12.1f %+7.1f%% %8.1f ms %8.1f ms' % (
+            new['concurrency'], old['rps'], new['rps'],
+            100.0 * (new['rps'] - old['rps']) / max(old['rps'], 1e-9), old['p99_ms'], new['p99_ms']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""Profile a service image under load and recommend a Fargate task size
+
+Runs the service's container image locally with the TASK_CPU/TASK_MEMORY of
+its current "task_size" context entry (gunicorn sizes its worker pool from
+them, as on Fargate), drives it at each request rate in --rates and records
+the CPU it used and its peak anonymous (RSS) memory from the container's
+cgroup. The recommendation is the smallest valid Fargate size that serves the
+highest rate (or --target-rate) at the service's autoscaling cpu_target and
+memory_target, i.e. where target tracking would settle. --write stores it in
+cdk.json, from where it reaches the task definitions and taskdef.json; only
+the two numbers of that service's entry change, the rest of the file keeps
+its order and formatting.
+
+The container gets --max-cpus so CPU use is measured rather than capped;
+run on an otherwise idle host. A new size can change the worker count, so
+rerun with the new size until the recommendation is stable.
+
+Usage:
+    python tools/profile_task_size.py flask --rates 25,50,100,200 --duration 30
+    python tools/profile_task_size.py nginx --image nginx-microservice:latest --write
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'Flask-microservice'))
+
+import loadtest  # noqa: E402
+from bench_serving import wait_until_up  # noqa: E402
+from stacks.task_size import smallest_task_size  # noqa: E402
+
+CDK_JSON = os.path.join(ROOT, 'cdk.json')
+SERVICES = {
+    'flask': ('Flask-microservice', '/api/test'),
+    'nginx': ('Nginx-microservice', '/nginx/'),
+}
+
+
+def docker(*args):
+    return subprocess.run(('docker',) + args, check=True, stdout=subprocess.PIPE,
+                          universal_newlines=True).stdout.strip()
+
+
+class CgroupReader(object):
+    """Read CPU and memory usage of a running container, cgroup v2 or v1"""
+
+    def __init__(self, container):
+        self.container = container
+        self.v2 = docker('exec', container, 'sh', '-c',
+                         'test -f /sys/fs/cgroup/cpu.stat && echo v2 || echo v1') == 'v2'
+
+    def _read(self, path):
+        return docker('exec', self.container, 'cat', '/sys/fs/cgroup/' + path)
+
+    def cpu_seconds(self):
+        if self.v2:
+            for line in self._read('cpu.stat').splitlines():
+                if line.startswith('usage_usec'):
+                    return int(line.split()[1]) / 1e6
+        return int(self._read('cpuacct/cpuacct.usage')) / 1e9
+
+    def rss_mib(self):
+        stat = dict(line.split() for line in
+                    self._read('memory.stat' if self.v2 else 'memory/memory.stat').splitlines())
+        return int(stat['anon' if self.v2 else 'total_rss']) / 2.0 ** 20
+
+
+def profile_rate(url, reader, rate, concurrency, duration):
+    """Drive url at rate and return the load result with vcpu and peak_mib"""
+    peak = [reader.rss_mib()]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.5):
+            peak.append(reader.rss_mib())
+
+    sampler = threading.Thread(target=sample)
+    before = reader.cpu_seconds()
+    started = time.monotonic()
+    sampler.start()
+    try:
+        result = loadtest.run(url, concurrency, duration, rate)
+    finally:
+        done.set()
+        sampler.join()
+    result['vcpu'] = (reader.cpu_seconds() - before) / (time.monotonic() - started)
+    result['peak_mib'] = max(peak)
+    return result
+
+
+def recommend(result, cpu_target, memory_target):
+    """Smallest task size serving result at the autoscaling utilization targets"""
+    cpu_units = result['vcpu'] * 1024 * 100.0 / cpu_target
+    memory_mib = result['peak_mib'] * 100.0 / memory_target
+    return smallest_task_size(cpu_units, memory_mib)
+
+
+def update_task_size(text, service, cpu, memory):
+    """Return cdk.json text with only context.task_size.<service> changed to cpu and memory"""
+    expected = json.loads(text)
+    if service not in expected['context']['task_size']:
+        raise ValueError('no task_size.%s entry in cdk.json' % service)
+    entry = re.search(r'"task_size"\s*:\s*\{.*?"%s"\s*:\s*\{([^{}]*)\}' % re.escape(service), text, re.S)
+    if entry is None:
+        raise ValueError('no task_size.%s entry in cdk.json' % service)
+    body = entry.group(1)
+    for key, value in (('cpu', cpu), ('memory', memory)):
+        body = re.sub(r'("%s"\s*:\s*)\d+' % key, lambda match: match.group(1) + str(value), body, count=1)
+    updated = text[:entry.start(1)] + body + text[entry.end(1):]
+
+    expected['context']['task_size'][service].update(cpu=cpu, memory=memory)
+    if json.loads(updated) != expected:
+        raise ValueError('could not update task_size.%s in cdk.json in place' % service)
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('service', choices=sorted(SERVICES))
+    parser.add_argument('--image', help='image to profile; built from the service directory by default')
+    parser.add_argument('--rates', default='25,50,100,200')
+    parser.add_argument('--target-rate', type=float,
+                        help='requests per second one task should serve; defaults to the highest rate')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--max-cpus', default='4')
+    parser.add_argument('--port', type=int, default=8300)
+    parser.add_argument('--write', action='store_true', help='store the recommendation in cdk.json')
+    args = parser.parse_args()
+
+    with open(CDK_JSON) as cdk_json:
+        cdk = json.load(cdk_json)
+    context = cdk['context']
+    size = context['task_size'][args.service]
+    scaling = context['autoscaling'][args.service]
+    directory, path = SERVICES[args.service]
+
+    image = args.image
+    if image is None:
+        image = 'profile-%s:latest' % args.service
+        docker('build', '-t', image, os.path.join(ROOT, directory))
+
+    container = docker('run', '-d', '--rm', '--cpus', args.max_cpus,
+                       '-e', 'TASK_CPU=%d' % size['cpu'], '-e', 'TASK_MEMORY=%d' % size['memory'],
+                       '-p', '%d:80' % args.port, image)
+    try:
+        url = 'http://127.0.0.1:%d%s' % (args.port, path)
+        wait_until_up(url, timeout=60.0)
+        reader = CgroupReader(container)
+        loadtest.run(url, args.concurrency, 5.0)  # warm up
+        print('%8s %10s %9s %8s %10s' % ('rate', 'req/s', 'p99 ms', 'vCPU', 'peak MiB'))
+        results = []
+        for rate in [float(rate) for rate in args.rates.split(',')]:
+            result = profile_rate(url, reader, rate, args.concurrency, args.duration)
+            results.append(result)
+            print('%8.0f %10.1f %9.1f %8.3f %10.1f' % (
+                rate, result['rps'], result['p99_ms'], result['vcpu'], result['peak_mib']))
+    finally:
+        docker('stop', container)
+
+    target_rate = args.target_rate or results[-1]['rps']
+    # Scale the closest measured rate linearly; memory does not shrink with load
+    closest = min(results, key=lambda result: abs(result['rps'] - target_rate))
+    scaled = dict(closest, vcpu=closest['vcpu'] * target_rate / max(closest['rps'], 1e-9))
+    cpu, memory = recommend(scaled, scaling['cpu_target'], scaling['memory_target'])
+    print('%s at %.0f req/s per task (cpu_target %d%%, memory_target %d%%): cpu %d / memory %d, currently %d / %d' % (
+        args.service, target_rate, scaling['cpu_target'], scaling['memory_target'],
+        cpu, memory, size['cpu'], size['memory']))
+
+    if args.write:
+        with open(CDK_JSON) as cdk_json:
+            text = cdk_json.read()
+        with open(CDK_JSON, 'w') as cdk_json:
+            cdk_json.write(update_task_size(text, args.service, cpu, memory))
+        print('updated task_size.%s in cdk.json' % args.service)
+
+
+if __name__ == '__main__':
+    main()
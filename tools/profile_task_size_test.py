@@ -0,0 +1,55 @@
+"""Unit test file for profile_task_size.py"""
+import json
+import unittest
+
+import profile_task_size
+
+CDK_JSON = '''{
+  "app": "python3 app.py",
+  "context": {
+    "env": "dev",
+    "task_size": {
+      "nginx": {"cpu": 256, "memory": 512},
+      "flask": {
+        "cpu": 256,
+        "memory": 512
+      }
+    },
+    "autoscaling": {"flask": {"cpu": 1, "memory": 2}}
+  }
+}
+'''
+
+
+class TestUpdateTaskSize(unittest.TestCase):
+    """--write changes only the profiled service's task size"""
+
+    def test_only_entry_changes(self):
+        """Test the rest of the file keeps its text, order and formatting"""
+        updated = profile_task_size.update_task_size(CDK_JSON, 'flask', 512, 1024)
+        self.assertEqual(CDK_JSON.replace('"cpu": 256,\n        "memory": 512',
+                                          '"cpu": 512,\n        "memory": 1024'), updated)
+        self.assertEqual({'cpu': 512, 'memory': 1024}, json.loads(updated)['context']['task_size']['flask'])
+
+    def test_inline_entry(self):
+        """Test a single-line entry is updated without touching its neighbours"""
+        updated = profile_task_size.update_task_size(CDK_JSON, 'nginx', 1024, 2048)
+        self.assertIn('"nginx": {"cpu": 1024, "memory": 2048},', updated)
+        self.assertIn('"autoscaling": {"flask": {"cpu": 1, "memory": 2}}', updated)
+
+    def test_repo_cdk_json(self):
+        """Test the repository's cdk.json can be updated in place"""
+        with open(profile_task_size.CDK_JSON) as cdk_json:
+            text = cdk_json.read()
+        size = json.loads(text)['context']['task_size']['flask']
+        updated = profile_task_size.update_task_size(text, 'flask', size['cpu'] * 2, size['memory'] * 2)
+        self.assertEqual(len(text.splitlines()), len(updated.splitlines()))
+
+    def test_missing_entry(self):
+        """Test a service without a task_size entry is an error"""
+        with self.assertRaises(ValueError):
+            profile_task_size.update_task_size(CDK_JSON.replace('"autoscaling": {"flask"', '"autoscaling": {"worker"'), 'worker', 256, 512)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+"""Publish static-content to the frontend bucket, uploading only what changed
+
+Builds the objects S3Stack used to deploy (originals, content-hashed copies
+and their gzip/brotli variants, see stacks/precompress.py and
+Flask-microservice/static_manifest.py) and compares them with the manifest
+of the previous publish stored in the bucket. Only new and changed objects
+are uploaded, in parallel and multipart above --part-size. Keys no longer
+published are deleted, except hashed copies, which pages rendered before
+the publish may still link. CloudFront is invalidated for exactly the
+changed and deleted paths, gzip/ and br/ copies included: the viewer-request
+function rewrites the URI before the cache lookup, so the edges cache those
+prefixed paths. New and hashed keys need no invalidation.
+
+Without a stored manifest (the first publish), objects already in the bucket
+are compared by ETag, which covers their content but not their metadata.
+
+--env looks up the bucket (the FlaskFrontendBucket export) and the
+distribution (/<env>/app-distribution-id); --endpoint-url points the S3
+client at a local stand-in such as MinIO.
+
+Usage:
+    python tools/publish_static.py --env dev
+    python tools/publish_static.py --bucket frontend --distribution-id E2EXAMPLE --dry-run
+    python tools/publish_static.py --bucket frontend --endpoint-url http://localhost:9000
+"""
+import argparse
+import concurrent.futures
+import fnmatch
+import hashlib
+import json
+import mimetypes
+import os
+import sys
+import time
+import urllib.parse
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'Flask-microservice'))
+
+import static_manifest  # noqa: E402
+from stacks.precompress import ENCODINGS, precompress  # noqa: E402
+
+SOURCE_DIR = os.path.join(ROOT, 'static-content')
+BUILD_DIR = os.path.join(ROOT, 'build', 'static-content')
+
+# Stored in the bucket after every publish; the next one diffs against it
+PUBLISHED_MANIFEST_KEY = 'publish-manifest.json'
+
+# Hashed names change with their content, so they may be cached for good
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Original names and templates are picked up within minutes of a publish
+MUTABLE_CACHE_CONTROL = 'public, max-age=300'
+
+PART_SIZE = 8 * 1024 * 1024
+# Beyond this many paths one wildcard invalidation is cheaper
+MAX_INVALIDATION_PATHS = 1000
+
+
+def file_digests(path, part_size=PART_SIZE):
+    """Return the sha256 of a file and the ETag S3 gives it when uploaded in part_size parts"""
+    sha256, whole, parts = hashlib.sha256(), hashlib.md5(), []
+    with open(path, 'rb') as content:
+        for chunk in iter(lambda: content.read(part_size), b''):
+            sha256.update(chunk)
+            whole.update(chunk)
+            parts.append(hashlib.md5(chunk).digest())
+    if os.path.getsize(path) >= part_size:
+        return sha256.hexdigest(), '%s-%d' % (hashlib.md5(b''.join(parts)).hexdigest(), len(parts))
+    return sha256.hexdigest(), whole.hexdigest()
+
+
+def local_objects(source=SOURCE_DIR, build_dir=BUILD_DIR, part_size=PART_SIZE):
+    """Return {key: object} for everything a publish of source puts in the bucket"""
+    static_manifest.fingerprint(source, build_dir)
+    objects = {}
+    for tree, cache_control in (('mutable', MUTABLE_CACHE_CONTROL), ('immutable', IMMUTABLE_CACHE_CONTROL)):
+        encoded = os.path.join(build_dir, tree + '-encoded')
+        precompress(os.path.join(build_dir, tree), encoded)
+        for encoding in ('identity',) + tuple(ENCODINGS):
+            for directory, _, names in os.walk(os.path.join(encoded, encoding)):
+                for name in names:
+                    path = os.path.join(directory, name)
+                    relative = os.path.relpath(path, os.path.join(encoded, encoding)).replace(os.sep, '/')
+                    sha256, etag = file_digests(path, part_size)
+                    key = relative if encoding == 'identity' else encoding + '/' + relative
+                    objects[key] = {
+                        'path': path,
+                        'etag': etag,
+                        'published': {
+                            'sha256': sha256,
+                            'cache_control': cache_control,
+                            'content_type': mimetypes.guess_type(relative)[0] or 'application/octet-stream',
+                            'content_encoding': None if encoding == 'identity' else encoding,
+                            'immutable': tree == 'immutable',
+                        },
+                    }
+    return objects
+
+
+def is_hashed(key):
+    for encoding in ENCODINGS:
+        if key.startswith(encoding + '/'):
+            key = key[len(encoding) + 1:]
+    return fnmatch.fnmatch(key, static_manifest.HASHED_PATTERN)
+
+
+def published_objects(s3, bucket, local):
+    """Return the stored manifest of the last publish, or one rebuilt from object ETags"""
+    try:
+        body = s3.get_object(Bucket=bucket, Key=PUBLISHED_MANIFEST_KEY)['Body'].read()
+        return json.loads(body)
+    except s3.exceptions.NoSuchKey:
+        pass
+    published = {}
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket):
+        for listed in page.get('Contents', []):
+            key = listed['Key']
+            if key == PUBLISHED_MANIFEST_KEY:
+                continue
+            if key in local and listed['ETag'].strip('"') == local[key]['etag']:
+                published[key] = local[key]['published']
+            else:
+                published[key] = {'etag': listed['ETag'].strip('"'), 'immutable': is_hashed(key)}
+    return published
+
+
+def diff(local, published):
+    """Return (upload, delete, invalidate) key lists"""
+    upload = sorted(key for key, entry in local.items() if published.get(key) != entry['published'])
+    delete = sorted(key for key, entry in published.items() if key not in local and not entry['immutable'])
+    # New keys were never cached and hashed keys never change. Variant keys
+    # stay in: CloudFront caches the gzip/ and br/ URIs its function rewrites to
+    invalidate = [key for key in upload if key in published and not local[key]['published']['immutable']]
+    return upload, delete, sorted(invalidate + delete)
+
+
+def upload_objects(s3, bucket, local, keys, concurrency, part_size):
+    config = TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size)
+
+    def upload(key):
+        published = local[key]['published']
+        extra = {'CacheControl': published['cache_control'], 'ContentType': published['content_type']}
+        if published['content_encoding']:
+            extra['ContentEncoding'] = published['content_encoding']
+        s3.upload_file(local[key]['path'], bucket, key, ExtraArgs=extra, Config=config)
+
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        # Hashed copies first, so no uploaded page links a missing object
+        for immutable in (True, False):
+            batch = [key for key in keys if local[key]['published']['immutable'] == immutable]
+            list(executor.map(upload, batch))
+
+
+def delete_objects(s3, bucket, keys):
+    for start in range(0, len(keys), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={
+            'Objects': [{'Key': key} for key in keys[start:start + 1000]],
+            'Quiet': True,
+        })
+
+
+def invalidation_paths(keys):
+    if len(keys) > MAX_INVALIDATION_PATHS:
+        return ['/*']
+    return ['/' + urllib.parse.quote(key) for key in keys]
+
+
+def publish(s3, bucket, cloudfront=None, distribution_id=None, source=SOURCE_DIR, build_dir=BUILD_DIR,
+            concurrency=8, part_size=PART_SIZE, dry_run=False):
+    """Bring bucket in line with source and return what was uploaded, deleted and invalidated"""
+    local = local_objects(source, build_dir, part_size)
+    published = published_objects(s3, bucket, local)
+    upload, delete, invalidate = diff(local, published)
+    paths = invalidation_paths(invalidate) if invalidate else []
+    if not dry_run:
+        upload_objects(s3, bucket, local, upload, concurrency, part_size)
+        # Hashed copies of earlier publishes stay listed, so they are never deleted
+        manifest = {key: entry for key, entry in published.items() if entry['immutable'] and key not in local}
+        manifest.update((key, entry['published']) for key, entry in local.items())
+        s3.put_object(Bucket=bucket, Key=PUBLISHED_MANIFEST_KEY, ContentType='application/json',
+                      Body=json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+        delete_objects(s3, bucket, delete)
+        if paths and distribution_id:
+            cloudfront.create_invalidation(DistributionId=distribution_id, InvalidationBatch={
+                'Paths': {'Quantity': len(paths), 'Items': paths},
+                'CallerReference': 'publish-static-%.6f' % time.time(),
+            })
+    return {'upload': upload, 'delete': delete, 'invalidate': paths,
+            'unchanged': len(local) - len(upload)}
+
+
+def lookup(env):
+    """Bucket and distribution id the CDK stacks created for env"""
+    exports = {}
+    for page in boto3.client('cloudformation').get_paginator('list_exports').paginate():
+        exports.update((export['Name'], export['Value']) for export in page['Exports'])
+    parameter = boto3.client('ssm').get_parameter(Name='/' + env + '/app-distribution-id')
+    return exports['FlaskFrontendBucket'], parameter['Parameter']['Value']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--env', help='look up the bucket and distribution of this environment')
+    parser.add_argument('--bucket')
+    parser.add_argument('--distribution-id', help='CloudFront distribution to invalidate')
+    parser.add_argument('--endpoint-url', help='S3 endpoint, e.g. a local stand-in')
+    parser.add_argument('--source', default=SOURCE_DIR)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--part-size', type=int, default=PART_SIZE, help='multipart part size in bytes')
+    parser.add_argument('--dry-run', action='store_true', help='only print what would change')
+    args = parser.parse_args()
+
+    bucket, distribution_id = args.bucket, args.distribution_id
+    if args.env:
+        bucket, distribution_id = lookup(args.env)
+    if not bucket:
+        parser.error('--bucket or --env is required')
+
+    result = publish(boto3.client('s3', endpoint_url=args.endpoint_url), bucket,
+                     boto3.client('cloudfront'), distribution_id, args.source,
+                     concurrency=args.concurrency, part_size=args.part_size, dry_run=args.dry_run)
+    for key in result['upload']:
+        print('upload  ' + key)
+    for key in result['delete']:
+        print('delete  ' + key)
+    for path in result['invalidate']:
+        print('invalidate ' + path)
+    print('%d uploaded, %d deleted, %d unchanged, %d paths invalidated%s' % (
+        len(result['upload']), len(result['delete']), result['unchanged'], len(result['invalidate']),
+        ' (dry run)' if args.dry_run else ''))
+
+
+if __name__ == '__main__':
+    main()
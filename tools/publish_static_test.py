@@ -0,0 +1,191 @@
+"""Unit test file for publish_static.py, against moto's in-memory S3 and CloudFront"""
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import boto3
+from botocore.config import Config
+from moto import mock_aws
+
+import publish_static
+
+BUCKET = 'frontend'
+CSS = b'body { color: red; }\n' * 50
+
+
+@mock_aws
+class TestPublishStatic(unittest.TestCase):
+    """Incremental publishing of static content"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.source = os.path.join(self.directory, 'source')
+        self.build_dir = os.path.join(self.directory, 'build')
+        self.write('static/css/site.css', CSS)
+        self.write('static/img/logo.png', b'\x89PNG' + bytes(range(256)))
+        self.write('templates/index.html', b'<html></html>')
+
+        # Without checksums moto stores ContentEncoding as sent, like S3 does
+        self.s3 = boto3.client('s3', region_name='us-east-1',
+                               config=Config(request_checksum_calculation='when_required'))
+        self.s3.create_bucket(Bucket=BUCKET)
+        self.cloudfront = boto3.client('cloudfront', region_name='us-east-1')
+        self.distribution_id = self.cloudfront.create_distribution(DistributionConfig={
+            'CallerReference': 'test',
+            'Comment': '',
+            'Enabled': True,
+            'Origins': {'Quantity': 1, 'Items': [{
+                'Id': 'bucket',
+                'DomainName': BUCKET + '.s3.amazonaws.com',
+                'S3OriginConfig': {'OriginAccessIdentity': ''},
+            }]},
+            'DefaultCacheBehavior': {
+                'TargetOriginId': 'bucket',
+                'ViewerProtocolPolicy': 'allow-all',
+                'MinTTL': 0,
+                'TrustedSigners': {'Enabled': False, 'Quantity': 0},
+                'ForwardedValues': {'QueryString': False, 'Cookies': {'Forward': 'none'}},
+            },
+        })['Distribution']['Id']
+
+    def write(self, relative, data):
+        path = os.path.join(self.source, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as content:
+            content.write(data)
+
+    def publish(self, **kwargs):
+        return publish_static.publish(self.s3, BUCKET, self.cloudfront, self.distribution_id,
+                                      self.source, self.build_dir, **kwargs)
+
+    def keys(self):
+        listed = self.s3.list_objects_v2(Bucket=BUCKET).get('Contents', [])
+        return sorted(listed_object['Key'] for listed_object in listed)
+
+    def invalidated(self):
+        listed = self.cloudfront.list_invalidations(DistributionId=self.distribution_id)['InvalidationList']
+        paths = []
+        for summary in listed.get('Items', []):
+            invalidation = self.cloudfront.get_invalidation(
+                DistributionId=self.distribution_id, Id=summary['Id'])['Invalidation']
+            paths.extend(invalidation['InvalidationBatch']['Paths']['Items'])
+        return sorted(paths)
+
+    def test_first_publish_uploads_everything(self):
+        """Test the first publish uploads every variant with its metadata and invalidates nothing"""
+        result = self.publish()
+        hashed = json.loads(self.s3.get_object(Bucket=BUCKET, Key='static/manifest.json')['Body'].read())
+        css = hashed['static/css/site.css']
+        self.assertEqual(sorted(result['upload']), sorted(key for key in self.keys()
+                                                          if key != publish_static.PUBLISHED_MANIFEST_KEY))
+        self.assertIn('gzip/' + css, result['upload'])
+        self.assertNotIn('br/' + hashed['static/img/logo.png'], result['upload'])
+        self.assertEqual([], result['invalidate'])
+        self.assertEqual([], self.invalidated())
+
+        original = self.s3.get_object(Bucket=BUCKET, Key='static/css/site.css')
+        self.assertEqual(publish_static.MUTABLE_CACHE_CONTROL, original['CacheControl'])
+        self.assertEqual('text/css', original['ContentType'])
+        self.assertEqual(CSS, original['Body'].read())
+        variant = self.s3.get_object(Bucket=BUCKET, Key='gzip/' + css)
+        self.assertEqual(publish_static.IMMUTABLE_CACHE_CONTROL, variant['CacheControl'])
+        self.assertEqual('gzip', variant['ContentEncoding'])
+        self.assertEqual(CSS, gzip.decompress(variant['Body'].read()))
+
+    def test_unchanged_publish_uploads_nothing(self):
+        """Test publishing the same content again uploads, deletes and invalidates nothing"""
+        first = self.publish()
+        second = self.publish()
+        self.assertEqual(([], [], []), (second['upload'], second['delete'], second['invalidate']))
+        self.assertEqual(len(first['upload']), second['unchanged'])
+
+    def test_changed_file(self):
+        """Test a changed file uploads only its objects and invalidates only its original names"""
+        self.publish()
+        self.write('static/css/site.css', CSS + b'a { color: blue; }\n')
+        result = self.publish()
+        hashed = static_css_name(self.s3)
+        self.assertEqual(sorted([
+            'static/css/site.css', 'gzip/static/css/site.css', 'br/static/css/site.css',
+            hashed, 'gzip/' + hashed, 'br/' + hashed,
+            'static/manifest.json', 'gzip/static/manifest.json', 'br/static/manifest.json',
+        ]), result['upload'])
+        self.assertEqual([], result['delete'])
+        self.assertEqual(sorted([
+            '/static/css/site.css', '/gzip/static/css/site.css', '/br/static/css/site.css',
+            '/static/manifest.json', '/gzip/static/manifest.json', '/br/static/manifest.json',
+        ]), self.invalidated())
+
+    def test_removed_file_keeps_hashed_copies(self):
+        """Test a removed file loses its original names but keeps its hashed copies"""
+        self.publish()
+        hashed = static_css_name(self.s3)
+        os.remove(os.path.join(self.source, 'static', 'css', 'site.css'))
+        result = self.publish()
+        self.assertEqual(['br/static/css/site.css', 'gzip/static/css/site.css', 'static/css/site.css'],
+                         result['delete'])
+        keys = self.keys()
+        self.assertNotIn('static/css/site.css', keys)
+        self.assertIn(hashed, keys)
+        self.assertIn('br/' + hashed, keys)
+        self.assertIn('/static/css/site.css', self.invalidated())
+        # Still listed, so a later publish does not see them as unknown objects
+        self.assertEqual([], self.publish()['upload'])
+
+    def test_without_stored_manifest(self):
+        """Test objects already in the bucket are compared by ETag when no manifest is stored"""
+        self.publish()
+        self.s3.delete_object(Bucket=BUCKET, Key=publish_static.PUBLISHED_MANIFEST_KEY)
+        self.s3.put_object(Bucket=BUCKET, Key='templates/index.html', Body=b'stale')
+        self.s3.put_object(Bucket=BUCKET, Key='templates/old.html', Body=b'old')
+        result = self.publish()
+        self.assertEqual(['templates/index.html'], result['upload'])
+        self.assertEqual(['templates/old.html'], result['delete'])
+        index = self.s3.get_object(Bucket=BUCKET, Key='templates/index.html')
+        self.assertEqual(b'<html></html>', index['Body'].read())
+
+    def test_multipart_upload(self):
+        """Test files above the part size are uploaded in parts and still match on the next publish"""
+        part_size = 5 * 1024 * 1024
+        self.write('static/img/large.png', os.urandom(part_size + 1024))
+        self.publish(part_size=part_size)
+        head = self.s3.head_object(Bucket=BUCKET, Key='static/img/large.png')
+        self.assertTrue(head['ETag'].strip('"').endswith('-2'))
+
+        self.s3.delete_object(Bucket=BUCKET, Key=publish_static.PUBLISHED_MANIFEST_KEY)
+        self.assertEqual([], self.publish(part_size=part_size)['upload'])
+
+    def test_dry_run(self):
+        """Test a dry run reports the changes without making them"""
+        result = self.publish(dry_run=True)
+        self.assertIn('static/css/site.css', result['upload'])
+        self.assertEqual([], self.keys())
+
+    def test_encoded_copies_invalidated(self):
+        """Test changed originals are invalidated with the gzip/ and br/ URIs CloudFront caches them under"""
+        local = {key: {'published': {'sha256': 'new', 'immutable': False}}
+                 for key in ('static/a.css', 'gzip/static/a.css', 'br/static/a.css', 'static/b.png')}
+        local['static/a.0123456789ab.css'] = {'published': {'sha256': 'new', 'immutable': True}}
+        published = {key: {'sha256': 'old', 'immutable': entry['published']['immutable']}
+                     for key, entry in local.items()}
+        _, _, invalidate = publish_static.diff(local, published)
+        self.assertEqual(['br/static/a.css', 'gzip/static/a.css', 'static/a.css', 'static/b.png'], invalidate)
+
+    def test_invalidation_paths(self):
+        """Test paths are quoted and collapse into one wildcard beyond the limit"""
+        self.assertEqual(['/static/a%20b.css'], publish_static.invalidation_paths(['static/a b.css']))
+        keys = ['static/%d.css' % number for number in range(publish_static.MAX_INVALIDATION_PATHS + 1)]
+        self.assertEqual(['/*'], publish_static.invalidation_paths(keys))
+
+
+def static_css_name(s3):
+    manifest = json.loads(s3.get_object(Bucket=BUCKET, Key='static/manifest.json')['Body'].read())
+    return manifest['static/css/site.css']
+
+
+if __name__ == '__main__':
+    unittest.main()